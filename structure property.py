@@ -6,24 +6,54 @@ Use conditions: [1] Cuboid sample
                 [2] Aperiodic boundary
                 [3] Monosize sample
 Usage: python structure-property.py -scenario 1000
+       python structure-property.py -scenario 1000 -cache
+       python structure-property.py -scenario 1000 -voronoi 8
+       python structure-property.py -scenario 1000 -symmetry symmetry.json
+       python structure-property.py -scenario 1000 -shell 3
+       python structure-property.py -scenario 1000 -face 3,8
+       python structure-property.py -scenario 1000 -output npz|parquet|hdf5|excel
+       python structure-property.py -scenario 1000 -output parquet -run
+       python structure-property.py -scenario 1000 -output none -store
+       python structure-property.py -scenario 1000 -jobs 4 -flight 8
+       python structure-property.py -scenario 1000 -parallel
+       python structure-property.py -scenario 1000 -fresh
+       python structure-property.py -bench read|voronoi|angular|radial|hull|boop|jobs|family
+path_ is either a directory of dump-<frame>.sample files or a single multi-timestep dump file.
+-bench read|angular|hull|boop compare with the old implementations in structure_property_reference.py.
 '''
 # Reference:
 # [1] Qi Wang* & Anubhav Jain*. A transferable machine learning framework linking interstice distribution and plastic heterogeneity in metallic glasses.
 # [2] E.D.Cubuk* R.J.S.Ivancic* S.S.Schoenholz*.Structure-property relationships from universal signatures of plasticity in disordered solids.
 # [3] E. D. Cubuk,1,∗ S. S. Schoenholz (Equal contribution),2,† J. M. Rieser. Identifying structural ﬂow defects in disordered solids using machine learning methods.
 from __future__ import division
-import re
 import math
 import os
+import time
+import itertools
+import json
+import hashlib
+import io
+import gzip
+import lzma
 import pyvoro
-import boo
 import requests
 import openpyxl
 import pandas as pd
 import numpy as np
-from numba import jit
+import numba
+import multiprocessing
+from multiprocessing import shared_memory
+from numba import jit, prange
 from sys import argv, exit
+from scipy import sparse
 from scipy.spatial import KDTree, ConvexHull
+from collections import namedtuple, deque
+from fractions import Fraction
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 
 def mkdir(path_write):
@@ -42,7 +72,7 @@ def mkdir(path_write):
 
 
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-@jit(nopython=True)
+@jit(nopython=True, cache=True)
 def compute_cos_ijk(posi, posj, posk):
     # 计算向量ij与ik的夹角的cos值
     eij = np.array([posj[0] - posi[0], posj[1] - posi[1], posj[2] - posi[2]])
@@ -51,7 +81,7 @@ def compute_cos_ijk(posi, posj, posk):
     return cos
 
 
-@jit(nopython=True)
+@jit(nopython=True, cache=True)
 def compute_dis(posj, posk):
     # 计算三维空间中两点的距离
     ejk = np.array([posk[0] - posj[0], posk[1] - posj[1], posk[2] - posj[2]])
@@ -59,7 +89,7 @@ def compute_dis(posj, posk):
     return dis
 
 
-@jit(nopython=True)
+@jit(nopython=True, cache=True)
 def compute_tetrahedron_volume(vertice1, vertice2, vertice3, vertice4):
     # 计算四面体的体积，通过给定四面体的四个顶点
     eij = np.array([vertice2[0] - vertice1[0], vertice2[1] - vertice1[1], vertice2[2] - vertice1[2]])
@@ -68,7 +98,7 @@ def compute_tetrahedron_volume(vertice1, vertice2, vertice3, vertice4):
     return abs(np.dot(eil, np.cross(eij, eik))) / 6
 
 
-@jit(nopython=True)
+@jit(nopython=True, cache=True)
 def compute_solide_angle(vertice1, vertice2, vertice3, vertice4):
     # 计算固体角
     eij = np.array([vertice2[0] - vertice1[0], vertice2[1] - vertice1[1], vertice2[2] - vertice1[2]])
@@ -82,7 +112,7 @@ def compute_solide_angle(vertice1, vertice2, vertice3, vertice4):
                            + np.dot(eij, eil) * len_eik + np.dot(eik, eil) * len_eij))
 
 
-@jit(nopython=True)
+@jit(nopython=True, cache=True)
 def compute_simplice_area(vertice1, vertice2, vertice3):
     # 计算三角形的面积，通过给定的三个顶点
     # problem1: compute error -> eij = eik causes error.
@@ -97,177 +127,319 @@ def compute_simplice_area(vertice1, vertice2, vertice3):
 
 
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-@jit(nopython=True)
-def compute_angular_element(neigh_id_input, distance_input, points_input, a_list, b_list, c_list, radius, like_input,
-                            neigh_id_length_index_input):
-    angular_value_in = np.empty_like(like_input)
-    for a in range(len(neigh_id_length_index_input)):
-        value1 = 0.0
-        value2 = 0.0
-        value3 = 0.0
-        value4 = 0.0
-        value5 = 0.0
-        value6 = 0.0
-        value7 = 0.0
-        value8 = 0.0
-        value9 = 0.0
-        value10 = 0.0
-        value11 = 0.0
-        value12 = 0.0
-        value13 = 0.0
-        value14 = 0.0
-        value15 = 0.0
-        value16 = 0.0
-        value17 = 0.0
-        value18 = 0.0
-        value19 = 0.0
-        value20 = 0.0
-        value21 = 0.0
-        value22 = 0.0
-        for b in range(neigh_id_length_index_input[a]):
-            for k_ in range(neigh_id_length_index_input[a] - b - 1):
-                k = k_ + b + 1
-                rij = distance_input[a][b]
-                rik = distance_input[a][k]
-                posi = points_input[a]
-                posj = points_input[neigh_id_input[a][b]]
-                posk = points_input[neigh_id_input[a][k]]
-                rjk = compute_dis(posj, posk)
-                cos_ijk = compute_cos_ijk(posi, posj, posk)
-                r_2 = rij ** 2 + rik ** 2 + rjk ** 2
-                value1 += math.exp(-(r_2 / (radius * a_list[0]) ** 2)) * (1 + b_list[0] * cos_ijk) ** c_list[0]
-                value2 += math.exp(-(r_2 / (radius * a_list[1]) ** 2)) * (1 + b_list[1] * cos_ijk) ** c_list[1]
-                value3 += math.exp(-(r_2 / (radius * a_list[2]) ** 2)) * (1 + b_list[2] * cos_ijk) ** c_list[2]
-                value4 += math.exp(-(r_2 / (radius * a_list[3]) ** 2)) * (1 + b_list[3] * cos_ijk) ** c_list[3]
-                value5 += math.exp(-(r_2 / (radius * a_list[4]) ** 2)) * (1 + b_list[4] * cos_ijk) ** c_list[4]
-                value6 += math.exp(-(r_2 / (radius * a_list[5]) ** 2)) * (1 + b_list[5] * cos_ijk) ** c_list[5]
-                value7 += math.exp(-(r_2 / (radius * a_list[6]) ** 2)) * (1 + b_list[6] * cos_ijk) ** c_list[6]
-                value8 += math.exp(-(r_2 / (radius * a_list[7]) ** 2)) * (1 + b_list[7] * cos_ijk) ** c_list[7]
-                value9 += math.exp(-(r_2 / (radius * a_list[8]) ** 2)) * (1 + b_list[8] * cos_ijk) ** c_list[8]
-                value10 += math.exp(-(r_2 / (radius * a_list[9]) ** 2)) * (1 + b_list[9] * cos_ijk) ** c_list[9]
-                value11 += math.exp(-(r_2 / (radius * a_list[10]) ** 2)) * (1 + b_list[10] * cos_ijk) ** c_list[10]
-                value12 += math.exp(-(r_2 / (radius * a_list[11]) ** 2)) * (1 + b_list[11] * cos_ijk) ** c_list[11]
-                value13 += math.exp(-(r_2 / (radius * a_list[12]) ** 2)) * (1 + b_list[12] * cos_ijk) ** c_list[12]
-                value14 += math.exp(-(r_2 / (radius * a_list[13]) ** 2)) * (1 + b_list[13] * cos_ijk) ** c_list[13]
-                value15 += math.exp(-(r_2 / (radius * a_list[14]) ** 2)) * (1 + b_list[14] * cos_ijk) ** c_list[14]
-                value16 += math.exp(-(r_2 / (radius * a_list[15]) ** 2)) * (1 + b_list[15] * cos_ijk) ** c_list[15]
-                value17 += math.exp(-(r_2 / (radius * a_list[16]) ** 2)) * (1 + b_list[16] * cos_ijk) ** c_list[16]
-                value18 += math.exp(-(r_2 / (radius * a_list[17]) ** 2)) * (1 + b_list[17] * cos_ijk) ** c_list[17]
-                value19 += math.exp(-(r_2 / (radius * a_list[18]) ** 2)) * (1 + b_list[18] * cos_ijk) ** c_list[18]
-                value20 += math.exp(-(r_2 / (radius * a_list[19]) ** 2)) * (1 + b_list[19] * cos_ijk) ** c_list[19]
-                value21 += math.exp(-(r_2 / (radius * a_list[20]) ** 2)) * (1 + b_list[20] * cos_ijk) ** c_list[20]
-                value22 += math.exp(-(r_2 / (radius * a_list[21]) ** 2)) * (1 + b_list[21] * cos_ijk) ** c_list[21]
-        angular_value_in[0][a] = value1
-        angular_value_in[1][a] = value2
-        angular_value_in[2][a] = value3
-        angular_value_in[3][a] = value4
-        angular_value_in[4][a] = value5
-        angular_value_in[5][a] = value6
-        angular_value_in[6][a] = value7
-        angular_value_in[7][a] = value8
-        angular_value_in[8][a] = value9
-        angular_value_in[9][a] = value10
-        angular_value_in[10][a] = value11
-        angular_value_in[11][a] = value12
-        angular_value_in[12][a] = value13
-        angular_value_in[13][a] = value14
-        angular_value_in[14][a] = value15
-        angular_value_in[15][a] = value16
-        angular_value_in[16][a] = value17
-        angular_value_in[17][a] = value18
-        angular_value_in[18][a] = value19
-        angular_value_in[19][a] = value20
-        angular_value_in[20][a] = value21
-        angular_value_in[21][a] = value22
+# 每帧只建一次 KDTree，在最大截断距离下查询一次，颗粒对按距离升序排列
+# 较小截断距离的邻域直接从前面截取，不再重新搜索
+# pairs: (M, 2) 颗粒对 (i < j); distance: (M, ) 对应的距离
+NeighbourList = namedtuple('NeighbourList', ['pairs', 'distance'])
+
+
+def build_neighbour_list(points, max_distance):
+    kd_tree = KDTree(points)
+    pairs = kd_tree.query_pairs(max_distance, output_type='ndarray').astype(np.int64)
+    distance = np.linalg.norm(points[pairs[:, 0]] - points[pairs[:, 1]], axis=1)
+    order = np.argsort(distance, kind='stable')
+    return NeighbourList(pairs=pairs[order], distance=distance[order])
+
+
+def slice_neighbour_list(neighbour_list, cutoff):
+    # 距离不大于 cutoff 的颗粒对及其距离
+    end = np.searchsorted(neighbour_list.distance, cutoff, side='right')
+    return neighbour_list.pairs[:end], neighbour_list.distance[:end]
+
+
+# 每个颗粒的邻域 (CSR): 第 i 个颗粒的邻居为 index[offset[i]:offset[i + 1]]，对应距离为 distance[offset[i]:offset[i + 1]]
+NeighbourCSR = namedtuple('NeighbourCSR', ['offset', 'index', 'distance'])
+
+
+def build_bond_csr(pairs, particle_number, distance=None, points=None):
+    # 由颗粒对 (i, j) 构建 CSR 邻域: 每个颗粒对同时加入 i 和 j 的邻域
+    # 同一颗粒的邻居保持颗粒对的先后顺序（与逐个 append 的结果相同）
+    pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+    if distance is None:
+        distance = np.linalg.norm(points[pairs[:, 0]] - points[pairs[:, 1]], axis=1)
+    row = pairs.ravel()
+    column = pairs[:, ::-1].ravel()
+    order = np.argsort(row, kind='stable')
+    offset = np.concatenate(([0], np.cumsum(np.bincount(row, minlength=particle_number))))
+    return NeighbourCSR(offset=offset, index=column[order], distance=np.repeat(distance, 2)[order])
+
+
+def csr_to_list(neighbour_csr):
+    # CSR 邻域转为每个颗粒一个邻居数组的列表
+    return np.split(neighbour_csr.index, neighbour_csr.offset[1:-1])
+
+
+def voronoi_bond(neighbour):
+    # voronoi 邻域 (CSR，含负数的边界编号) 转为颗粒对 (x, y), y > x
+    # 只保留编号较小颗粒的邻域中出现的颗粒对，剔除面积小于平均面积百分之五的邻域点所造成的不对称由此消除
+    row = np.repeat(np.arange(len(neighbour.offset) - 1), np.diff(neighbour.offset))
+    use = neighbour.index > row
+    return np.stack((row[use], neighbour.index[use]), axis=1)
+
+
+def segment_statistic(value, offset):
+    # 按 CSR 分段计算 min, max, mean, std (ddof=0)，没有元素的段为 0
+    count = np.diff(offset)
+    row = np.repeat(np.arange(len(count)), count)
+    statistic = np.zeros(shape=[len(count), 4])
+    full = count > 0
+    start = offset[:-1][full]
+    statistic[full, 0] = np.minimum.reduceat(value, start)
+    statistic[full, 1] = np.maximum.reduceat(value, start)
+    mean = np.bincount(row, weights=value, minlength=len(count))[full] / count[full]
+    statistic[full, 2] = mean
+    deviation = value - np.repeat(statistic[:, 2], count)
+    statistic[full, 3] = np.sqrt(np.bincount(row, weights=deviation ** 2, minlength=len(count))[full] / count[full])
+    return statistic
+
+
+@jit(nopython=True, parallel=True, nogil=True, cache=True)
+def segment_reduce(feature_input, neigh_offset_input, neigh_index_input):
+    # 按 CSR 邻域对所有特征列求邻居的统计量，按颗粒并行
+    # feature (N, F) -> (N, 5F)，第 f 列对应 5f..5f+4 列: self, min, max, mean, std (ddof=0)，没有邻居时后四项为 0
+    particle_number, feature_number = feature_input.shape
+    feature_MRO = np.zeros((particle_number, 5 * feature_number))
+    for b in prange(particle_number):
+        start = neigh_offset_input[b]
+        neigh_number = neigh_offset_input[b + 1] - start
+        for f in range(feature_number):
+            feature_MRO[b, 5 * f] = feature_input[b, f]
+            if neigh_number == 0:
+                continue
+            value_min = feature_input[neigh_index_input[start], f]
+            value_max = value_min
+            value_sum = 0.0
+            for c in range(neigh_number):
+                value = feature_input[neigh_index_input[start + c], f]
+                value_min = min(value_min, value)
+                value_max = max(value_max, value)
+                value_sum += value
+            mean = value_sum / neigh_number
+            square = 0.0
+            for c in range(neigh_number):
+                square += (feature_input[neigh_index_input[start + c], f] - mean) ** 2
+            feature_MRO[b, 5 * f + 1] = value_min
+            feature_MRO[b, 5 * f + 2] = value_max
+            feature_MRO[b, 5 * f + 3] = mean
+            feature_MRO[b, 5 * f + 4] = math.sqrt(square / neigh_number)
+    return feature_MRO
+
+
+def build_shell_csr(neigh_offset, neigh_index, shell_number, block_size=65536):
+    # 由第一层邻域的邻接矩阵按行分块做稀疏矩阵乘法，得到第 2..shell_number 层邻域（图距离恰为 k 的颗粒）
+    # 每次只处理 block_size 行，内存随块大小而不是颗粒数的平方增长
+    particle_number = len(neigh_offset) - 1
+    adjacency = sparse.csr_matrix((np.ones(len(neigh_index), dtype=np.int32), neigh_index, neigh_offset),
+                                  shape=(particle_number, particle_number))
+    shell_block = [[] for k in range(shell_number - 1)]
+    for start in range(0, particle_number, block_size):
+        row = np.arange(start, min(start + block_size, particle_number))
+        frontier = adjacency[row]
+        visited = frontier + sparse.csr_matrix((np.ones(len(row), dtype=np.int32), (np.arange(len(row)), row)),
+                                               shape=frontier.shape)
+        for k in range(shell_number - 1):
+            reach = frontier @ adjacency
+            reach.data[:] = 1
+            frontier = reach - reach.multiply(visited)
+            frontier.eliminate_zeros()
+            frontier.sort_indices()
+            visited = visited + frontier
+            shell_block[k].append(frontier)
+    shell_csr = []
+    for block in shell_block:
+        shell = sparse.vstack(block, format='csr')
+        shell_csr.append(NeighbourCSR(offset=shell.indptr.astype(np.int64), index=shell.indices.astype(np.int64),
+                                      distance=None))
+    return shell_csr
+
+
+def shell_reduce(feature_SRO, shell_csr):
+    # 每层邻域上各列的 min, max, mean, std (不含 self)，返回每层一个数组的列表
+    if not shell_csr:
+        return []
+    keep = np.arange(5 * feature_SRO.shape[1]) % 5 != 0
+    return [segment_reduce(feature_SRO, shell.offset, shell.index)[:, keep] for shell in shell_csr]
+
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+@jit(nopython=True, parallel=True, nogil=True, cache=True)
+def compute_angular_value(neigh_offset_input, neigh_index_input, points_input, width_input, width_id_input,
+                          b_unique_input, c_unique_input, term_id_input, radius):
+    # 角向对称函数，与旧的 compute_angular_element (structure_property_reference) 的结果相同（只差舍入误差），按颗粒并行
+    # exp(-(rij^2 + rik^2 + rjk^2) / w^2) = exp(-rij^2 / w^2) * exp(-rik^2 / w^2) * exp(-rjk^2 / w^2)
+    # 每个颗粒先算出每条键的向量、长度和每个不同宽度 w 的高斯因子，三元组内每个宽度只算一次 exp
+    # 每个不同的 (b, c) 只算一次 (1 + b * cos) ** c，再按 width_id/term_id 组合成各参数行
+    particle_number = len(neigh_offset_input) - 1
+    function_number = len(width_id_input)
+    width_number = len(width_input)
+    term_number = len(b_unique_input)
+    inverse_width = np.empty(width_number)
+    for w in range(width_number):
+        inverse_width[w] = 1.0 / (radius * width_input[w]) ** 2
+    angular_value_in = np.zeros((particle_number, function_number))
+    for a in prange(particle_number):
+        start = neigh_offset_input[a]
+        neigh_number = neigh_offset_input[a + 1] - start
+        vector = np.empty((neigh_number, 3))
+        length = np.empty(neigh_number)
+        gauss = np.empty((neigh_number, width_number))
+        for b in range(neigh_number):
+            j = neigh_index_input[start + b]
+            vector[b, 0] = points_input[j, 0] - points_input[a, 0]
+            vector[b, 1] = points_input[j, 1] - points_input[a, 1]
+            vector[b, 2] = points_input[j, 2] - points_input[a, 2]
+            r_2 = vector[b, 0] ** 2 + vector[b, 1] ** 2 + vector[b, 2] ** 2
+            length[b] = math.sqrt(r_2)
+            for w in range(width_number):
+                gauss[b, w] = math.exp(-r_2 * inverse_width[w])
+        value = np.zeros(function_number)
+        gauss_ijk = np.empty(width_number)
+        term = np.empty(term_number)
+        for b in range(neigh_number):
+            for k in range(b + 1, neigh_number):
+                cos_ijk = (vector[b, 0] * vector[k, 0] + vector[b, 1] * vector[k, 1]
+                           + vector[b, 2] * vector[k, 2]) / (length[b] * length[k])
+                rjk_2 = ((vector[b, 0] - vector[k, 0]) ** 2 + (vector[b, 1] - vector[k, 1]) ** 2
+                         + (vector[b, 2] - vector[k, 2]) ** 2)
+                for w in range(width_number):
+                    gauss_ijk[w] = gauss[b, w] * gauss[k, w] * math.exp(-rjk_2 * inverse_width[w])
+                for t in range(term_number):
+                    term[t] = (1.0 + b_unique_input[t] * cos_ijk) ** c_unique_input[t]
+                for f in range(function_number):
+                    value[f] += gauss_ijk[width_id_input[f]] * term[term_id_input[f]]
+        for f in range(function_number):
+            angular_value_in[a, f] = value[f]
     return angular_value_in
 
 
-@jit(nopython=True)
-def compute_radial_value(delta_radius_input, distance_length_index_input, distance_input,
-                         like_input, delta_r_input):
-    radial_value_in = np.empty_like(like_input)
-    for a in range(len(delta_radius_input)):
-        delta_radius_now = delta_radius_input[a]
-        for b in range(len(distance_input)):
-            value = 0.0
-            for c in range(distance_length_index_input[b]):
-                value += math.exp(-0.5 * ((distance_input[b][c] - delta_radius_now) / delta_r_input) ** 2)
-            radial_value_in[a][b] = value
+def group_angular_parameter(a_list, b_list, c_list):
+    # 角向参数中不同的宽度 a 与不同的 (b, c) 组合，以及每一行参数对应的编号
+    width, width_id = np.unique(np.asarray(a_list, dtype=np.float64), return_inverse=True)
+    term, term_id = np.unique(np.stack((np.asarray(b_list, dtype=np.float64), np.asarray(c_list, dtype=np.float64)),
+                                       axis=1), axis=0, return_inverse=True)
+    return width, width_id.ravel(), term[:, 0].copy(), term[:, 1].copy(), term_id.ravel()
+
+
+@jit(nopython=True, parallel=True, nogil=True, cache=True)
+def compute_radial_value(neigh_offset_input, distance_input, centre_input, sigma_input, window_input):
+    # 径向对称函数，按颗粒并行: 第 k 个壳层的值为 sum(exp(-0.5 * ((r - centre[k]) / sigma) ** 2))
+    # 每个距离只加到中心在 r ± window * sigma 以内的壳层上 (centre 升序)，window 为 inf 时为精确计算
+    particle_number = len(neigh_offset_input) - 1
+    half_width = window_input * sigma_input
+    radial_value_in = np.zeros((particle_number, len(centre_input)))
+    for a in prange(particle_number):
+        for c in range(neigh_offset_input[a], neigh_offset_input[a + 1]):
+            distance_now = distance_input[c]
+            shell_start = np.searchsorted(centre_input, distance_now - half_width)
+            shell_end = np.searchsorted(centre_input, distance_now + half_width, side='right')
+            for k in range(shell_start, shell_end):
+                radial_value_in[a, k] += math.exp(-0.5 * ((distance_now - centre_input[k]) / sigma_input) ** 2)
     return radial_value_in
 
 
-def compute_symmetry_functions(points, radius):
+# 对称函数参数集，长度均以颗粒半径为单位
+# angular: (a, b, c) 参数行; radial_centre / radial_sigma: 径向壳层中心与宽度
+# radial_window: 径向截断窗口（单位为 sigma），None 为精确计算; cutoff: 邻域截断距离
+SymmetryParameter = namedtuple('SymmetryParameter', ['angular', 'radial_centre', 'radial_sigma', 'radial_window',
+                                                     'cutoff'])
+DEFAULT_SYMMETRY_PARAMETER = SymmetryParameter(
+    angular=((14.638, -1, 1), (14.638, 1, 1), (14.638, -1, 2), (14.638, 1, 2), (2.554, -1, 1), (2.554, 1, 1),
+             (2.554, -1, 2), (2.554, 1, 2), (1.648, 1, 1), (1.648, 1, 2), (1.204, 1, 1), (1.204, 1, 2),
+             (1.204, 1, 4), (1.204, 1, 16), (0.933, 1, 1), (0.933, 1, 2), (0.933, 1, 4), (0.933, 1, 16),
+             (0.695, 1, 1), (0.695, 1, 2), (0.695, 1, 4), (0.695, 1, 16)),
+    radial_centre=tuple(np.linspace(0.1, 5.0, 50).tolist()),
+    radial_sigma=0.1,
+    radial_window=6.0,
+    cutoff=5.0)
+
+
+def load_symmetry_parameter(parameter_file):
+    # 从 json 文件读取参数集，未给出的项取默认值，例如
+    # {"angular_index": [0, 1, 8], "radial": {"start": 0.1, "stop": 3.0, "number": 30}, "radial_window": 6.0}
+    # angular: [[a, b, c], ...]; radial: 壳层中心列表或 {"start", "stop", "number"}
+    # angular_index / radial_index: 只保留这些编号的参数行（编号按 angular / radial 中的顺序）
+    with open(parameter_file) as file:
+        setting = json.load(file)
+    default = DEFAULT_SYMMETRY_PARAMETER
+    angular = [tuple(float(x) for x in row) for row in setting.get('angular', default.angular)]
+    if any(len(row) != 3 for row in angular):
+        raise ValueError('%s: every angular row must be [a, b, c]' % parameter_file)
+    radial = setting.get('radial', default.radial_centre)
+    if isinstance(radial, dict):
+        radial = np.linspace(radial['start'], radial['stop'], int(radial['number'])).tolist()
+    radial = [float(x) for x in radial]
+    if 'angular_index' in setting:
+        angular = [angular[k] for k in setting['angular_index']]
+    if 'radial_index' in setting:
+        radial = [radial[k] for k in setting['radial_index']]
+    if np.any(np.diff(radial) < 0):
+        raise ValueError('%s: radial shell centres must be ascending' % parameter_file)
+    radial_window = setting.get('radial_window', default.radial_window)
+    return SymmetryParameter(angular=tuple(angular),
+                             radial_centre=tuple(radial),
+                             radial_sigma=float(setting.get('radial_sigma', default.radial_sigma)),
+                             radial_window=None if radial_window is None else float(radial_window),
+                             cutoff=float(setting.get('cutoff', default.cutoff)))
+
+
+symmetry_kernel_cache = {}
+
+
+def make_symmetry_kernel(parameter):
+    # 按参数集生成专用的 numba 核，参数作为编译期常量，同一参数集只编译一次
+    # 返回 kernel(neigh_offset, neigh_index, distance, points, radius) -> (N, 角向数 + 径向数)
+    if parameter in symmetry_kernel_cache:
+        return symmetry_kernel_cache[parameter]
+    angular_number = len(parameter.angular)
+    radial_number = len(parameter.radial_centre)
+    if angular_number > 0:
+        a_list, b_list, c_list = np.array(parameter.angular, dtype=np.float64).T
+        width, width_id, b_unique, c_unique, term_id = group_angular_parameter(a_list, b_list, c_list)
+    else:
+        width, width_id, b_unique, c_unique, term_id = (np.zeros(0), np.zeros(0, dtype=np.int64), np.zeros(0),
+                                                        np.zeros(0), np.zeros(0, dtype=np.int64))
+    centre = np.array(parameter.radial_centre, dtype=np.float64)
+    sigma = parameter.radial_sigma
+    window = np.inf if parameter.radial_window is None else parameter.radial_window
+
+    @jit(nopython=True, nogil=True)
+    def symmetry_kernel(neigh_offset_input, neigh_index_input, distance_input, points_input, radius):
+        particle_number = len(neigh_offset_input) - 1
+        value = np.empty((particle_number, angular_number + radial_number))
+        if angular_number > 0:
+            value[:, :angular_number] = compute_angular_value(neigh_offset_input, neigh_index_input, points_input,
+                                                              width, width_id, b_unique, c_unique, term_id, radius)
+        if radial_number > 0:
+            value[:, angular_number:] = compute_radial_value(neigh_offset_input, distance_input, centre * radius,
+                                                             sigma * radius, window)
+        return value
+
+    symmetry_kernel_cache[parameter] = symmetry_kernel
+    return symmetry_kernel
+
+
+def compute_symmetry_functions(points, radius, neighbour_list=None, parameter=None):
+    # parameter: SymmetryParameter，None 时为默认的 22 个角向函数和 50 个径向函数
     # Compute symmetry function values of the whole granular system.
     # Reference: [1] Structure-property relationships from universal signatures of plasticity in disordered solids.
     #            [2] Identifying structural ﬂow defects in disordered solids using machine learning methods.
     # step1. set the constant
+    if parameter is None:
+        parameter = DEFAULT_SYMMETRY_PARAMETER
     particle_number = len(points)
     radius_for_input = radius[0]
-    a_list_for_input = np.array([14.638, 14.638, 14.638, 14.638, 2.554, 2.554, 2.554, 2.554, 1.648, 1.648, 1.204, 1.204,
-                                 1.204, 1.204, 0.933, 0.933, 0.933, 0.933, 0.695, 0.695, 0.695, 0.695])
-    b_list_for_input = np.array([-1, 1, -1, 1, -1, 1, -1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1])
-    c_list_for_input = np.array([1, 1, 2, 2, 1, 1, 2, 2, 1, 2, 1, 2, 4, 16, 1, 2, 4, 16, 1, 2, 4, 16])
-    like_for_angular = np.empty(shape=[22, particle_number])
-    like_for_radial = np.empty(shape=[50, particle_number])
-    single_radius = radius[0]
-    delta_r = 0.1 * single_radius
-    delta_radius = np.array([np.linspace(0.1, 5.0, 50)[i] * single_radius for i in range(50)])
     # step2. compute neighbour information by KDTree
-    # 2.1 kd tree
-    max_distance = 5.0 * radius[0]
-    kd_tree = KDTree(points)
-    pairs = list(kd_tree.query_pairs(max_distance))
-    # 2.2 distance for every pairs
-    dis_use = []
-    for x in range(len(pairs)):
-        dis = ((points[pairs[x][0]][0] - points[pairs[x][1]][0]) ** 2
-               + (points[pairs[x][0]][1] - points[pairs[x][1]][1]) ** 2
-               + (points[pairs[x][0]][2] - points[pairs[x][1]][2]) ** 2) ** 0.5
-        if dis <= max_distance:
-            dis_use.append(dis)
-    # 2.3 bonds of every particle
-    bonds = []
-    for x in range(particle_number):
-        bonds.append([])
-    for x in range(len(pairs)):
-        bonds[pairs[x][0]].append(pairs[x][1])
-        bonds[pairs[x][1]].append(pairs[x][0])
+    # pairs within cutoff and their distance
+    max_distance = parameter.cutoff * radius[0]
+    if neighbour_list is None:
+        neighbour_list = build_neighbour_list(points, max_distance)
+    pairs, dis_use = slice_neighbour_list(neighbour_list, max_distance)
     # step3. modify neighbour information for next compute
-    # 3.1 number of neighbours of every particle
-    neigh_id_length_index = []
-    for i in range(len(bonds)):
-        neigh_id_length_index.append(len(bonds[i]))
-    # 3.2 neighbour id array
-    neigh_id = np.zeros(shape=[particle_number, max(neigh_id_length_index)], dtype=int)
-    for i in range(len(bonds)):
-        for j in range(len(bonds[i])):
-            neigh_id[i][j] = bonds[i][j]
-    neigh_id_length_index_array = np.array(neigh_id_length_index)
-    # 3.3 neighbour distance information
-    distance = []
-    for x in range(particle_number):
-        distance.append([])
-    for x in range(len(dis_use)):
-        distance[pairs[x][0]].append(dis_use[x])
-        distance[pairs[x][1]].append(dis_use[x])
-    distance_length_index = []
-    for i in range(len(distance)):
-        distance_length_index.append(len(distance[i]))
-    distance_array = np.zeros(shape=[particle_number, max(distance_length_index)])
-    for i in range(len(distance)):
-        for j in range(len(distance[i])):
-            distance_array[i][j] = distance[i][j]
-    distance_length_index_array = np.array(distance_length_index)
-    # step4. compute
-    # 4.1 angular value
-    angular_value = compute_angular_element(neigh_id, distance_array, points, a_list_for_input, b_list_for_input,
-                                            c_list_for_input, radius_for_input, like_for_angular,
-                                            neigh_id_length_index_array).T
-    # 4.2 radial value
-    radial_value = compute_radial_value(delta_radius, distance_length_index_array, distance_array, like_for_radial,
-                                        delta_r).T
-    # 4.3 stack
-    symmetry_function_value = np.hstack((angular_value, radial_value))
+    bond_csr = build_bond_csr(pairs, particle_number, dis_use)
+    # step4. compute angular and radial value with the kernel of this parameter set
+    symmetry_kernel = make_symmetry_kernel(parameter)
+    symmetry_function_value = symmetry_kernel(bond_csr.offset, bond_csr.index, bond_csr.distance,
+                                              np.ascontiguousarray(points, dtype=np.float64), radius_for_input)
     return symmetry_function_value
 
 
@@ -275,19 +447,10 @@ def compute_symmetry_functions(points, radius):
 
 
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-def compute_interstice_distance(voronoi_neighbour_use_input, distance_input, radius_input):
-    interstice_distance_in = []
-    for a in range(len(voronoi_neighbour_use_input)):
-        interstice_distance_now = []
-        for b in range(len(voronoi_neighbour_use_input[a])):
-            interstice = (distance_input[a][b] - (radius_input[voronoi_neighbour_use_input[a][b]] + radius_input[a])) / \
-                         distance_input[a][b]
-            interstice_distance_now.append(interstice)
-        interstice_distance_in.append([np.min(interstice_distance_now),
-                                       np.max(interstice_distance_now),
-                                       np.mean(interstice_distance_now),
-                                       np.std(interstice_distance_now)])
-    return np.array(interstice_distance_in)
+def compute_interstice_distance(voronoi_csr, radius_input):
+    interstice = (voronoi_csr.distance - (radius_input[voronoi_csr.index]
+                                          + np.repeat(radius_input, np.diff(voronoi_csr.offset)))) / voronoi_csr.distance
+    return segment_statistic(interstice, voronoi_csr.offset)
 
 
 '''
@@ -316,7 +479,7 @@ def compute_interstice_area_polysize(voronoi_neighbour_use_input, points_input,
     return interstice_area_in
 
 
-@jit(nopython=True)
+@jit(nopython=True, cache=True)
 def compute_interstice_area_polysize_single_particle(simplice, points_now, radius_now, interstice_area_mid):
     interstice_area_x = interstice_area_mid
     for a in range(len(simplice)):
@@ -336,219 +499,135 @@ def compute_interstice_area_polysize_single_particle(simplice, points_now, radiu
 '''
 
 
-def compute_interstice_area_monosize(voronoi_neighbour_use_input, points_input, radius_input):
-    interstice_area_in = []
-    for a in range(len(voronoi_neighbour_use_input)):
-        if len(voronoi_neighbour_use_input[a]) >= 4:
-            points_now = []
-            for b in range(len(voronoi_neighbour_use_input[a])):
-                points_now.append(points_input[voronoi_neighbour_use_input[a][b]])
-            ch = ConvexHull(points_now)
-            simplice = np.array(ch.simplices)
-            interstice_area_mid = np.zeros(shape=[len(simplice), ])
-            interstice_area_x = compute_interstice_area_monosize_single_particle(simplice,
-                                                                                 np.array(points_now),
-                                                                                 radius_input,
-                                                                                 interstice_area_mid)
-            interstice_area_in.append([np.min(interstice_area_x),
-                                       np.max(interstice_area_x),
-                                       np.mean(interstice_area_x),
-                                       np.std(interstice_area_x, ddof=1)])
-        else:
-            interstice_area_in.append([0.0, 0.0, 0.0, 0.0])
-    return np.array(interstice_area_in)
-
-
-@jit(nopython=True)
-def compute_interstice_area_monosize_single_particle(simplice, points_now, radius_input, interstice_area_mid):
-    interstice_area_x = interstice_area_mid
-    for a in range(len(simplice)):
-        area_triangle = compute_simplice_area(points_now[simplice[a][0]],
-                                              points_now[simplice[a][1]], points_now[simplice[a][2]])
-        area_pack = (math.pi * radius_input ** 2) / 4
-        interstice_area_x[a] = (area_triangle - area_pack) / area_triangle
-    return interstice_area_x
-
-
-def compute_interstice_volume(voronoi_neighbour_use_input, points_input, radius_input):
-    interstice_volume_in = []
-    for a in range(len(voronoi_neighbour_use_input)):
-        if len(voronoi_neighbour_use_input[a]) >= 4:
-            points_now = []
-            radius_now = []
-            origin_particle = points_input[a]
-            origin_radius = radius_input[a]
-            for b in range(len(voronoi_neighbour_use_input[a])):
-                points_now.append(points_input[voronoi_neighbour_use_input[a][b]])
-                radius_now.append(radius_input[voronoi_neighbour_use_input[a][b]])
-            ch = ConvexHull(points_now)
-            simplice = np.array(ch.simplices)
-            interstice_volume_mid = np.zeros(shape=[len(simplice), ])
-            interstice_volume_x = compute_interstice_volume_single_particle(simplice,
-                                                                            np.array(points_now),
-                                                                            np.array(radius_now),
-                                                                            interstice_volume_mid,
-                                                                            origin_particle,
-                                                                            origin_radius)
-
-            interstice_volume_in.append([np.min(interstice_volume_x),
-                                         np.max(interstice_volume_x),
-                                         np.mean(interstice_volume_x),
-                                         np.std(interstice_volume_x, ddof=1)])
-        else:
-            interstice_volume_in.append([0.0, 0.0, 0.0, 0.0])
-    return np.array(interstice_volume_in)
-
-
-@jit(nopython=True)
-def compute_interstice_volume_single_particle(simplice, points_now, radius_now, interstice_volume_mid,
-                                              origin_particle, origin_radius):
-    interstice_volume_x = interstice_volume_mid
-    for a in range(len(simplice)):
-        volume_triangle = compute_tetrahedron_volume(points_now[simplice[a][0]],
-                                                     points_now[simplice[a][1]], points_now[simplice[a][2]],
-                                                     origin_particle)
-        if volume_triangle == 0:
-            # 处于边界上的颗粒计算时会触发错误，在此随机赋予一个值，因为边界上的颗粒不参与到以后的计算中
-            interstice_volume_x[a] = 0
-        else:
-            volume_pack = (compute_solide_angle(origin_particle, points_now[simplice[a][0]], points_now[simplice[a][1]],
-                                                points_now[simplice[a][2]])
+# 每个颗粒的 Voronoi 邻居点集的凸包只建一次，三角面片以扁平数组存储
+# simplex[simplex_offset[a]:simplex_offset[a + 1]] 为颗粒 a 的面片（全局颗粒编号），邻居少于 4 个的颗粒没有面片
+NeighbourHull = namedtuple('NeighbourHull', ['simplex_offset', 'simplex'])
+# 由凸包得到的 interstice area、interstice volume (min, max, mean, std) 与 cluster packing efficiency
+HullFeature = namedtuple('HullFeature', ['interstice_area', 'interstice_volume', 'cluster_packing_efficiency'])
+
+
+def build_neighbour_hull(voronoi_csr, points):
+    particle_number = len(voronoi_csr.offset) - 1
+    neigh_number = np.diff(voronoi_csr.offset)
+    simplex_number = np.zeros(particle_number, dtype=np.int64)
+    simplex_list = [np.zeros((0, 3), dtype=np.int64)]
+    for a in np.flatnonzero(neigh_number >= 4):
+        neigh = voronoi_csr.index[voronoi_csr.offset[a]:voronoi_csr.offset[a + 1]]
+        simplice = ConvexHull(points[neigh]).simplices
+        simplex_list.append(neigh[simplice])
+        simplex_number[a] = len(simplice)
+    simplex_offset = np.zeros(particle_number + 1, dtype=np.int64)
+    np.cumsum(simplex_number, out=simplex_offset[1:])
+    return NeighbourHull(simplex_offset, np.ascontiguousarray(np.vstack(simplex_list), dtype=np.int64))
+
+
+@jit(nopython=True, cache=True)
+def segment_min_max_mean_std(value):
+    # 与 np.min, np.max, np.mean, np.std(ddof=1) 相同，只有一个元素时 std 为 0
+    mean = np.mean(value)
+    if len(value) < 2:
+        return np.min(value), np.max(value), mean, 0.0
+    square = 0.0
+    for c in range(len(value)):
+        square += (value[c] - mean) ** 2
+    return np.min(value), np.max(value), mean, math.sqrt(square / (len(value) - 1))
+
+
+@jit(nopython=True, parallel=True, nogil=True, cache=True)
+def compute_hull_feature(simplex_offset_input, simplex_input, points_input, radius_input, area_radius):
+    # 一次遍历所有颗粒的凸包面片，同时得到 interstice area（单一粒径 area_radius）、interstice volume 与 cpe
+    # 结果与旧的 compute_interstice_area_monosize, compute_interstice_volume, compute_cluster_packing_efficiency 相同
+    # (见 structure_property_reference)
+    particle_number = len(simplex_offset_input) - 1
+    interstice_area = np.zeros((particle_number, 4))
+    interstice_volume = np.zeros((particle_number, 4))
+    cluster_packing_efficiency = np.zeros(particle_number)
+    area_pack = (math.pi * area_radius ** 2) / 4
+    for a in prange(particle_number):
+        start = simplex_offset_input[a]
+        simplex_number = simplex_offset_input[a + 1] - start
+        if simplex_number == 0:
+            continue
+        origin_particle = points_input[a]
+        origin_radius = radius_input[a]
+        area_x = np.empty(simplex_number)
+        volume_x = np.empty(simplex_number)
+        triangle_volume_sum = 0.0
+        pack_volume_sum = 0.0
+        for b in range(simplex_number):
+            i = simplex_input[start + b, 0]
+            j = simplex_input[start + b, 1]
+            k = simplex_input[start + b, 2]
+            area_triangle = compute_simplice_area(points_input[i], points_input[j], points_input[k])
+            area_x[b] = (area_triangle - area_pack) / area_triangle
+            volume_triangle = compute_tetrahedron_volume(points_input[i], points_input[j], points_input[k],
+                                                         origin_particle)
+            volume_pack = (compute_solide_angle(origin_particle, points_input[i], points_input[j], points_input[k])
                            * origin_radius ** 3 +
-                           compute_solide_angle(points_now[simplice[a][2]], origin_particle,
-                                                points_now[simplice[a][0]], points_now[simplice[a][1]])
-                           * radius_now[simplice[a][2]] ** 3 +
-                           compute_solide_angle(points_now[simplice[a][1]],
-                                                points_now[simplice[a][2]], origin_particle, points_now[simplice[a][0]])
-                           * radius_now[simplice[a][1]] ** 3 +
-                           compute_solide_angle(points_now[simplice[a][0]], points_now[simplice[a][1]],
-                                                points_now[simplice[a][2]], origin_particle) * radius_now[
-                               simplice[a][0]] ** 3) \
-                          / 3
-            interstice_volume_x[a] = (volume_triangle - volume_pack) / volume_triangle
-    return interstice_volume_x
-
-
-@jit(nopython=True)
-def interstice_distribution_MRO(interstice_distance, interstice_area, interstice_volume,
-                                MRO_array, f_use_array, voronoi_neighbour, neigh_id_length_index):
-    feature_MRO = np.empty_like(MRO_array)
-    for aa in range(4):
-        a = 5 * aa
-        feature_now = interstice_distance[:, aa]
-        for b in range(len(voronoi_neighbour)):
-            f_use_not = np.zeros_like(f_use_array)
-            for c in range(neigh_id_length_index[b]):
-                f_use_not[c] = feature_now[voronoi_neighbour[b][c]]
-            f_use = f_use_not[0: neigh_id_length_index[b]]
-            feature_MRO[a][b] = feature_now[b]
-            feature_MRO[a + 1][b] = np.min(f_use)
-            feature_MRO[a + 2][b] = np.max(f_use)
-            feature_MRO[a + 3][b] = np.mean(f_use)
-            mean = np.mean(f_use)
-            square = 0.0
-            for c in range(len(f_use)):
-                square += (f_use[c] - mean) ** 2
-            sqrt = math.sqrt((square / len(f_use)))
-            feature_MRO[a + 4][b] = sqrt
-    for aa in range(4):
-        a = 5 * aa + 20
-        feature_now = interstice_area[:, aa]
-        for b in range(len(voronoi_neighbour)):
-            f_use_not = np.zeros_like(f_use_array)
-            for c in range(neigh_id_length_index[b]):
-                f_use_not[c] = feature_now[voronoi_neighbour[b][c]]
-            f_use = f_use_not[0: neigh_id_length_index[b]]
-            feature_MRO[a][b] = feature_now[b]
-            feature_MRO[a + 1][b] = np.min(f_use)
-            feature_MRO[a + 2][b] = np.max(f_use)
-            feature_MRO[a + 3][b] = np.mean(f_use)
-            mean = np.mean(f_use)
-            square = 0.0
-            for c in range(len(f_use)):
-                square += (f_use[c] - mean) ** 2
-            sqrt = math.sqrt((square / len(f_use)))
-            feature_MRO[a + 4][b] = sqrt
-    for aa in range(4):
-        a = 5 * aa + 40
-        feature_now = interstice_volume[:, aa]
-        for b in range(len(voronoi_neighbour)):
-            f_use_not = np.zeros_like(f_use_array)
-            for c in range(neigh_id_length_index[b]):
-                f_use_not[c] = feature_now[voronoi_neighbour[b][c]]
-            f_use = f_use_not[0: neigh_id_length_index[b]]
-            feature_MRO[a][b] = feature_now[b]
-            feature_MRO[a + 1][b] = np.min(f_use)
-            feature_MRO[a + 2][b] = np.max(f_use)
-            feature_MRO[a + 3][b] = np.mean(f_use)
-            mean = np.mean(f_use)
-            square = 0.0
-            for c in range(len(f_use)):
-                square += (f_use[c] - mean) ** 2
-            sqrt = math.sqrt((square / len(f_use)))
-            feature_MRO[a + 4][b] = sqrt
-    return feature_MRO.T
-
-
-def compute_interstice_distribution(neighbour, points, radius):
+                           compute_solide_angle(points_input[k], origin_particle, points_input[i], points_input[j])
+                           * radius_input[k] ** 3 +
+                           compute_solide_angle(points_input[j], points_input[k], origin_particle, points_input[i])
+                           * radius_input[j] ** 3 +
+                           compute_solide_angle(points_input[i], points_input[j], points_input[k], origin_particle)
+                           * radius_input[i] ** 3) / 3
+            # 处于边界上的颗粒四面体体积可能为 0，与 compute_interstice_volume 相同赋 0
+            if volume_triangle == 0:
+                volume_x[b] = 0
+            else:
+                volume_x[b] = (volume_triangle - volume_pack) / volume_triangle
+            triangle_volume_sum += volume_triangle
+            pack_volume_sum += volume_pack
+        interstice_area[a, 0], interstice_area[a, 1], interstice_area[a, 2], interstice_area[a, 3] = \
+            segment_min_max_mean_std(area_x)
+        interstice_volume[a, 0], interstice_volume[a, 1], interstice_volume[a, 2], interstice_volume[a, 3] = \
+            segment_min_max_mean_std(volume_x)
+        # 所有四面体体积均为 0 时（边界上的颗粒）cpe 赋 0
+        if triangle_volume_sum != 0:
+            cluster_packing_efficiency[a] = pack_volume_sum / triangle_volume_sum
+    return interstice_area, interstice_volume, cluster_packing_efficiency
+
+
+def compute_neighbour_hull_feature(voronoi_csr, points, radius):
+    # interstice distribution 与 conventional feature 共用的凸包特征，每帧计算一次
+    hull = build_neighbour_hull(voronoi_csr, points)
+    interstice_area, interstice_volume, cluster_packing_efficiency = compute_hull_feature(
+        hull.simplex_offset, hull.simplex, np.ascontiguousarray(points, dtype=np.float64),
+        np.ascontiguousarray(radius, dtype=np.float64), radius[0])
+    return HullFeature(interstice_area, interstice_volume, cluster_packing_efficiency)
+
+
+def interstice_distribution_MRO(interstice_distance, interstice_area, interstice_volume, neigh_offset, neigh_index,
+                                shell_csr=None):
+    # interstice distance, area, volume 各 4 列，每列依次为 self, min, max, mean, std
+    # shell_csr: 第 2, 3, ... 层邻域，每层在最后追加各列的 min, max, mean, std
+    feature_SRO = np.hstack((interstice_distance, interstice_area, interstice_volume))
+    return np.hstack([segment_reduce(feature_SRO, neigh_offset, neigh_index)]
+                     + shell_reduce(feature_SRO, shell_csr))
+
+
+def compute_interstice_distribution(neighbour, points, radius, hull_feature=None, shell_csr=None,
+                                    voronoi_bonds=None):
     # compute interstice distribution of the whole granular system, include SRO(short range order), MRO(medium range order)
+    # hull_feature: compute_neighbour_hull_feature 的结果，None 时在此计算
+    # voronoi_bonds: voronoi_bond(neighbour) 的结果，给出时不再使用 neighbour
+    # shell_csr: build_shell_csr 得到的第 2, 3, ... 层 Voronoi 邻域，给出时追加这些层的 MRO
     # Reference: [1] Structure-property relationships from universal signatures of plasticity in disordered solids.
     # step1. set constant
-    particle_number = len(neighbour)
+    particle_number = len(points)
     # step2. modify origin voronoi neighbour
-    voronoi_neighbour = []
-    for x in range(len(neighbour)):
-        voronoi_neighbour_now = []
-        for value in neighbour[x]:
-            if value >= 0:
-                voronoi_neighbour_now.append(value)
-        voronoi_neighbour.append(voronoi_neighbour_now)
-    bonds = []
-    for x in range(len(voronoi_neighbour)):
-        for y in range(len(voronoi_neighbour[x])):
-            if voronoi_neighbour[x][y] > x:
-                bonds.append([x, voronoi_neighbour[x][y]])
-    bonds = np.array(bonds)
-    voronoi_neighbour_use = []
-    for x in range(particle_number):
-        voronoi_neighbour_use.append([])
-    for x in range(len(bonds)):
-        voronoi_neighbour_use[bonds[x][0]].append(bonds[x][1])
-        voronoi_neighbour_use[bonds[x][1]].append(bonds[x][0])
-    neigh_id_length_index = []
-    for x in range(len(voronoi_neighbour_use)):
-        neigh_id_length_index.append(len(voronoi_neighbour_use[x]))
-    neigh_id = np.zeros(shape=[particle_number, max(neigh_id_length_index)], dtype=int)
-    for x in range(len(voronoi_neighbour_use)):
-        for y in range(len(voronoi_neighbour_use[x])):
-            neigh_id[x][y] = int(voronoi_neighbour_use[x][y])
-    neigh_id_length_index = np.array(neigh_id_length_index)
-    # step3. distance for every pairs
-    dis_use = []
-    for x in range(len(bonds)):
-        dis = ((points[bonds[x][0]][0] - points[bonds[x][1]][0]) ** 2
-               + (points[bonds[x][0]][1] - points[bonds[x][1]][1]) ** 2
-               + (points[bonds[x][0]][2] - points[bonds[x][1]][2]) ** 2) ** 0.5
-        dis_use.append(dis)
-    # step4. neighbour distance of every particle
-    distance = []
-    for x in range(particle_number):
-        distance.append([])
-    for x in range(len(bonds)):
-        distance[bonds[x][0]].append(dis_use[x])
-        distance[bonds[x][1]].append(dis_use[x])
-    # step5. compute
-    # 5.1 compute interstice distance
-    interstice_distance = compute_interstice_distance(voronoi_neighbour_use, distance, radius)
-    # 5.2 compute interstice area
-    interstice_area = compute_interstice_area_monosize(voronoi_neighbour_use, points, radius[0])
-    # 5.3 compute interstice volume
-    interstice_volume = compute_interstice_volume(voronoi_neighbour_use, points, radius)
-    # 5.4 MRO, compute the medium range order feature of interstice_distance, interstice_area and interstice_volume
-    MRO_array = np.empty(shape=[60, particle_number])
-    f_use_array = np.empty(shape=[particle_number, ])
+    bonds = voronoi_bond(neighbour) if voronoi_bonds is None else voronoi_bonds
+    voronoi_csr = build_bond_csr(bonds, particle_number, points=points)
+    if hull_feature is None:
+        hull_feature = compute_neighbour_hull_feature(voronoi_csr, points, radius)
+    # step3. compute
+    # 3.1 compute interstice distance
+    interstice_distance = compute_interstice_distance(voronoi_csr, radius)
+    # 3.2 interstice area and 3.3 interstice volume from the neighbour hull
+    interstice_area = hull_feature.interstice_area
+    interstice_volume = hull_feature.interstice_volume
+    # 3.4 MRO, compute the medium range order feature of interstice_distance, interstice_area and interstice_volume
     MRO_interstice_distribution = interstice_distribution_MRO(interstice_distance, interstice_area, interstice_volume,
-                                                              MRO_array, f_use_array, neigh_id, neigh_id_length_index)
+                                                              voronoi_csr.offset, voronoi_csr.index, shell_csr)
     return MRO_interstice_distribution
 
 
@@ -556,557 +635,1789 @@ def compute_interstice_distribution(neighbour, points, radius):
 
 
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-def compute_coordination_number_by_cutoff_distance(points_input, radius_input):
+def compute_coordination_number_by_cutoff_distance(points_input, radius_input, neighbour_list=None):
     maxdistance = 3.0 * radius_input[0]
-    kdtree = KDTree(points_input)
-    pairs = list(kdtree.query_pairs(maxdistance))
-    cutoff_bonds = []
-    for a in range(len(points_input)):
-        cutoff_bonds.append([])
-    for a in range(len(pairs)):
-        cutoff_bonds[pairs[a][0]].append(pairs[a][1])
-        cutoff_bonds[pairs[a][1]].append(pairs[a][0])
-    coordination_number_by_cutoff_distance_in = np.zeros(shape=[len(points_input), ])
-    for a in range(len(cutoff_bonds)):
-        coordination_number_by_cutoff_distance_in[a] = len(cutoff_bonds[a])
+    if neighbour_list is None:
+        neighbour_list = build_neighbour_list(points_input, maxdistance)
+    pairs, distance = slice_neighbour_list(neighbour_list, maxdistance)
+    coordination_number_by_cutoff_distance_in = np.bincount(pairs.ravel(),
+                                                            minlength=len(points_input)).astype(np.float64)
     return coordination_number_by_cutoff_distance_in
 
 
-def compute_cellfraction(voro_input, radius_input):
-    volume = []
-    for a in range(len(voro_input)):
-        volume.append(voro_input[a]['volume'])
+def compute_cellfraction(tessellation, radius_input):
     ball_volume = (np.max(radius_input) ** 3) * 4 * math.pi / 3
-    cellfraction_in = [ball_volume / volume[a] for a in range(len(voro_input))]
+    cellfraction_in = ball_volume / tessellation.volume
     return cellfraction_in
 
 
-def compute_weight_i_fold_symm(voro_input, area_all_input):
-    # Reference: [1] Structure-property relationships from universal signatures of plasticity in disordered solids.
-    particle_number = len(voro_input)
-    area_weight_i_fold_symm = {}
-    area_weight_i_fold_symm3_in = np.zeros(shape=[particle_number, ])
-    area_weight_i_fold_symm4_in = np.zeros(shape=[particle_number, ])
-    area_weight_i_fold_symm5_in = np.zeros(shape=[particle_number, ])
-    area_weight_i_fold_symm6_in = np.zeros(shape=[particle_number, ])
-    area_weight_i_fold_symm7_in = np.zeros(shape=[particle_number, ])
-    for a in range(len(voro_input)):
-        faces_in = voro_input[a]['faces']
-        vertices_id_length = []
-        for b in range(len(faces_in)):
-            vertices_id_length.append(len(faces_in[b]['vertices']))
-        id3 = [c for c, b in enumerate(vertices_id_length) if b == 3]
-        id4 = [c for c, b in enumerate(vertices_id_length) if b == 4]
-        id5 = [c for c, b in enumerate(vertices_id_length) if b == 5]
-        id6 = [c for c, b in enumerate(vertices_id_length) if b == 6]
-        id7 = [c for c, b in enumerate(vertices_id_length) if b == 7]
-        area3, area4, area5, area6, area7 = 0, 0, 0, 0, 0
-        for b in range(len(id3)):
-            area3 += area_all_input[a][id3[b]]
-        for b in range(len(id4)):
-            area4 += area_all_input[a][id4[b]]
-        for b in range(len(id5)):
-            area5 += area_all_input[a][id5[b]]
-        for b in range(len(id6)):
-            area6 += area_all_input[a][id6[b]]
-        for b in range(len(id7)):
-            area7 += area_all_input[a][id7[b]]
-        area_total = area3 + area4 + area5 + area6 + area7
-        area_weight_i_fold_symm3_in[a] = area3 / area_total
-        area_weight_i_fold_symm4_in[a] = area4 / area_total
-        area_weight_i_fold_symm5_in[a] = area5 / area_total
-        area_weight_i_fold_symm6_in[a] = area6 / area_total
-        area_weight_i_fold_symm7_in[a] = area7 / area_total
-    area_weight_i_fold_symm['3'] = area_weight_i_fold_symm3_in
-    area_weight_i_fold_symm['4'] = area_weight_i_fold_symm4_in
-    area_weight_i_fold_symm['5'] = area_weight_i_fold_symm5_in
-    area_weight_i_fold_symm['6'] = area_weight_i_fold_symm6_in
-    area_weight_i_fold_symm['7'] = area_weight_i_fold_symm7_in
-    return area_weight_i_fold_symm
-
-
-def compute_voronoi_idx(voro_input):
+# 每个 cell 中各阶面（面的顶点数）的个数、个数分数与面积分数，阶数范围为 order_range[0]..order_range[1]
+FaceOrderHistogram = namedtuple('FaceOrderHistogram', ['order', 'count', 'fraction', 'area_fraction'])
+
+
+def compute_face_order_histogram(tessellation, order_range=(3, 7)):
+    # 对 (cell, 面阶数) 编号做一次 bincount，范围外的面不计入
     # Reference: [1] Structure-property relationships from universal signatures of plasticity in disordered solids.
     #            [2] H.L.Peng M.Z.Li* and W.H.Wang. Structural signature of plastic deformation in metallic glasses.
-    particle_number = len(voro_input)
-    voronoi_idx = {}
-    i_fold_symm = {}
-    voronoi_idx3_in = np.zeros(shape=[particle_number, ])
-    voronoi_idx4_in = np.zeros(shape=[particle_number, ])
-    voronoi_idx5_in = np.zeros(shape=[particle_number, ])
-    voronoi_idx6_in = np.zeros(shape=[particle_number, ])
-    voronoi_idx7_in = np.zeros(shape=[particle_number, ])
-    i_fold_symm3_in = np.zeros(shape=[particle_number, ])
-    i_fold_symm4_in = np.zeros(shape=[particle_number, ])
-    i_fold_symm5_in = np.zeros(shape=[particle_number, ])
-    i_fold_symm6_in = np.zeros(shape=[particle_number, ])
-    i_fold_symm7_in = np.zeros(shape=[particle_number, ])
-    for a in range(len(voro_input)):
-        faces_in = voro_input[a]['faces']
-        vertices_id_length = []
-        for b in range(len(faces_in)):
-            vertices_id_length.append(len(faces_in[b]['vertices']))
-        count_all = vertices_id_length.count(3) + vertices_id_length.count(4) \
-                    + vertices_id_length.count(5) + vertices_id_length.count(6) \
-                    + vertices_id_length.count(7)
-        voronoi_idx3_in[a] = vertices_id_length.count(3)
-        voronoi_idx4_in[a] = vertices_id_length.count(4)
-        voronoi_idx5_in[a] = vertices_id_length.count(5)
-        voronoi_idx6_in[a] = vertices_id_length.count(6)
-        voronoi_idx7_in[a] = vertices_id_length.count(7)
-        i_fold_symm3_in[a] = vertices_id_length.count(3) / count_all
-        i_fold_symm4_in[a] = vertices_id_length.count(4) / count_all
-        i_fold_symm5_in[a] = vertices_id_length.count(5) / count_all
-        i_fold_symm6_in[a] = vertices_id_length.count(6) / count_all
-        i_fold_symm7_in[a] = vertices_id_length.count(7) / count_all
-    voronoi_idx['3'] = voronoi_idx3_in
-    voronoi_idx['4'] = voronoi_idx4_in
-    voronoi_idx['5'] = voronoi_idx5_in
-    voronoi_idx['6'] = voronoi_idx6_in
-    voronoi_idx['7'] = voronoi_idx7_in
-    i_fold_symm['3'] = i_fold_symm3_in
-    i_fold_symm['4'] = i_fold_symm4_in
-    i_fold_symm['5'] = i_fold_symm5_in
-    i_fold_symm['6'] = i_fold_symm6_in
-    i_fold_symm['7'] = i_fold_symm7_in
-    return voronoi_idx, i_fold_symm
-
-
-def compute_boop(voronoi_neighbour, points, radius):
+    particle_number = len(tessellation.volume)
+    order_min, order_max = order_range
+    order_number = order_max - order_min + 1
+    cell = np.repeat(np.arange(particle_number), np.diff(tessellation.cell_face_offset))
+    use = (tessellation.face_vertex_number >= order_min) & (tessellation.face_vertex_number <= order_max)
+    key = cell[use] * order_number + (tessellation.face_vertex_number[use] - order_min)
+    count = np.bincount(key, minlength=particle_number * order_number).reshape(particle_number, order_number)
+    area = np.bincount(key, weights=tessellation.face_area[use],
+                       minlength=particle_number * order_number).reshape(particle_number, order_number)
+    count = count.astype(np.float64)
+    return FaceOrderHistogram(order=np.arange(order_min, order_max + 1), count=count,
+                              fraction=count / np.sum(count, axis=1, keepdims=True),
+                              area_fraction=area / np.sum(area, axis=1, keepdims=True))
+
+
+# 批量计算键取向序参数 (bond orientational order)，与 pyboo 的 bonds2qlm, coarsegrain_qlm, ql, wl 定义相同
+# qlm 按 l 依次排列，每个 l 只存 m = 0..l，负 m 由 q(l, -m) = (-1)^m conj(q(l, m)) 得到
+wigner_3j_cache = {}
+
+
+def compute_wigner_3j(l, m1, m2, m3):
+    # Racah 公式，(l l l; m1 m2 m3)，先用有理数精确求出平方再开方
+    if m1 + m2 + m3 != 0:
+        return 0.0
+    factorial = math.factorial
+    total = Fraction(0)
+    for k in range(max(0, -m1, m2), min(l, l - m1, l + m2) + 1):
+        total += Fraction((-1) ** k, factorial(k) * factorial(k + m1) * factorial(k - m2) * factorial(l - k)
+                          * factorial(l - k - m1) * factorial(l - k + m2))
+    if total == 0:
+        return 0.0
+    square = (Fraction(factorial(l) ** 3, factorial(3 * l + 1)) * factorial(l + m1) * factorial(l - m1)
+              * factorial(l + m2) * factorial(l - m2) * factorial(l + m3) * factorial(l - m3) * total ** 2)
+    sign = (-1) ** (m3 % 2) * (1 if total > 0 else -1)
+    return sign * math.sqrt(square)
+
+
+def wigner_3j_table(l_list):
+    # wl 求和中所有 m1 + m2 + m3 = 0 的项: 每项的 (l 编号, m1, m2, m3, 系数)，按 l_list 缓存
+    if l_list in wigner_3j_cache:
+        return wigner_3j_cache[l_list]
+    term = []
+    for x, l in enumerate(l_list):
+        for m1 in range(-l, l + 1):
+            for m2 in range(-l, l + 1):
+                m3 = -m1 - m2
+                if -l <= m3 <= l:
+                    term.append([x, m1, m2, m3, compute_wigner_3j(l, m1, m2, m3)])
+    term = np.array(term)
+    table = (term[:, 0].astype(np.int64), term[:, 1:4].astype(np.int64), term[:, 4].copy())
+    wigner_3j_cache[l_list] = table
+    return table
+
+
+@jit(nopython=True, parallel=True, nogil=True, cache=True)
+def compute_bond_ylm(vector_input, l_input, l_offset_input):
+    # 每条键的球谐函数 Y(l, m), m = 0..l，所有 l 在一次遍历中由归一化连带勒让德函数的递推得到（含 Condon-Shortley 相位）
+    # 极角与方位角与 pyboo 的 cart2sph 相同，方位角由 arctan2 得到
+    bond_number = len(vector_input)
+    l_max = np.max(l_input)
+    ylm = np.zeros((bond_number, l_offset_input[-1]), dtype=np.complex128)
+    for b in prange(bond_number):
+        x = vector_input[b, 0]
+        y = vector_input[b, 1]
+        z = vector_input[b, 2]
+        r = math.sqrt(x * x + y * y + z * z)
+        cos_theta = z / r
+        sin_theta = math.sqrt(x * x + y * y) / r
+        phi = math.atan2(y, x)
+        if phi < 0:
+            phi += 2 * math.pi
+        legendre = np.zeros((l_max + 1, l_max + 1))
+        legendre[0, 0] = math.sqrt(1.0 / (4 * math.pi))
+        for m in range(1, l_max + 1):
+            legendre[m, m] = -math.sqrt((2 * m + 1) / (2.0 * m)) * sin_theta * legendre[m - 1, m - 1]
+        for m in range(l_max):
+            legendre[m + 1, m] = math.sqrt(2 * m + 3.0) * cos_theta * legendre[m, m]
+        for m in range(l_max + 1):
+            for l in range(m + 2, l_max + 1):
+                a_lm = math.sqrt((4.0 * l * l - 1) / (l * l - m * m))
+                a_l1m = math.sqrt((4.0 * (l - 1) * (l - 1) - 1) / ((l - 1) * (l - 1) - m * m))
+                legendre[l, m] = a_lm * (cos_theta * legendre[l - 1, m] - legendre[l - 2, m] / a_l1m)
+        for x_l in range(len(l_input)):
+            l = l_input[x_l]
+            for m in range(l + 1):
+                ylm[b, l_offset_input[x_l] + m] = legendre[l, m] * complex(math.cos(m * phi), math.sin(m * phi))
+    return ylm
+
+
+@jit(nopython=True, parallel=True, nogil=True, cache=True)
+def sum_bond_ylm(ylm_input, bond_offset_input, bond_index_input):
+    # 每个颗粒所属键的 Y(l, m) 之和除以键数 (至少为 1)，即 pyboo 的 bonds2qlm
+    particle_number = len(bond_offset_input) - 1
+    qlm = np.zeros((particle_number, ylm_input.shape[1]), dtype=np.complex128)
+    for a in prange(particle_number):
+        start = bond_offset_input[a]
+        bond_number = bond_offset_input[a + 1] - start
+        for c in range(bond_number):
+            for k in range(ylm_input.shape[1]):
+                qlm[a, k] += ylm_input[bond_index_input[start + c], k]
+        for k in range(ylm_input.shape[1]):
+            qlm[a, k] /= max(1, bond_number)
+    return qlm
+
+
+@jit(nopython=True, parallel=True, nogil=True, cache=True)
+def coarse_grain_qlm(qlm_input, neigh_offset_input, neigh_index_input):
+    # 邻居的 qlm 之和除以邻居数 (至少为 1)，不含自身，即所有颗粒都在内部时 pyboo 的 coarsegrain_qlm
+    particle_number = len(neigh_offset_input) - 1
+    Qlm = np.zeros_like(qlm_input)
+    for a in prange(particle_number):
+        start = neigh_offset_input[a]
+        neigh_number = neigh_offset_input[a + 1] - start
+        for c in range(neigh_number):
+            for k in range(qlm_input.shape[1]):
+                Qlm[a, k] += qlm_input[neigh_index_input[start + c], k]
+        for k in range(qlm_input.shape[1]):
+            Qlm[a, k] /= max(1, neigh_number)
+    return Qlm
+
+
+@jit(nopython=True, cache=True)
+def get_qlm_value(qlm_input, a, offset, m):
+    # 负 m 由 (-1)^m conj(q(l, -m)) 得到
+    if m >= 0:
+        return qlm_input[a, offset + m]
+    if (-m) % 2 == 0:
+        return qlm_input[a, offset - m].conjugate()
+    return -qlm_input[a, offset - m].conjugate()
+
+
+@jit(nopython=True, parallel=True, nogil=True, cache=True)
+def compute_ql_wl(qlm_input, l_input, l_offset_input, term_l_input, term_m_input, term_w3j_input):
+    # 所有 l 的二阶不变量 ql 与三阶不变量 wl（未归一化），与 pyboo 的 ql, wl 相同
+    particle_number = len(qlm_input)
+    l_number = len(l_input)
+    ql = np.zeros((particle_number, l_number))
+    wl = np.zeros((particle_number, l_number))
+    for a in prange(particle_number):
+        for x_l in range(l_number):
+            offset = l_offset_input[x_l]
+            q = qlm_input[a, offset].real ** 2 + qlm_input[a, offset].imag ** 2
+            for m in range(1, l_input[x_l] + 1):
+                q += 2 * (qlm_input[a, offset + m].real ** 2 + qlm_input[a, offset + m].imag ** 2)
+            ql[a, x_l] = math.sqrt(4 * math.pi / (2 * l_input[x_l] + 1) * q)
+        for t in range(len(term_l_input)):
+            offset = l_offset_input[term_l_input[t]]
+            product = (get_qlm_value(qlm_input, a, offset, term_m_input[t, 0])
+                       * get_qlm_value(qlm_input, a, offset, term_m_input[t, 1])
+                       * get_qlm_value(qlm_input, a, offset, term_m_input[t, 2]))
+            wl[a, term_l_input[t]] += term_w3j_input[t] * product.real
+    return ql, wl
+
+
+def compute_bond_orientational_order(points, bonds, l_list):
+    # 一组键上所有 l 的 q, w (每个颗粒) 与粗粒化后的 Q, W，各为 (N, len(l_list))
+    particle_number = len(points)
+    bonds = np.asarray(bonds, dtype=np.int64).reshape(-1, 2)
+    l_input = np.array(l_list, dtype=np.int64)
+    l_offset = np.concatenate(([0], np.cumsum(l_input + 1)))
+    term_l, term_m, term_w3j = wigner_3j_table(tuple(l_list))
+    # 每条键的方向只算一次，两端颗粒共用（与 pyboo 相同，l 为偶数时与方向无关）
+    vector = points[bonds[:, 1]] - points[bonds[:, 0]]
+    ylm = compute_bond_ylm(np.ascontiguousarray(vector, dtype=np.float64), l_input, l_offset)
+    # 每个颗粒所属的键编号 (CSR)
+    row = bonds.ravel()
+    order = np.argsort(row, kind='stable')
+    bond_offset = np.concatenate(([0], np.cumsum(np.bincount(row, minlength=particle_number))))
+    bond_index = np.repeat(np.arange(len(bonds)), 2)[order]
+    qlm = sum_bond_ylm(ylm, bond_offset, bond_index)
+    neighbour_csr = build_bond_csr(bonds, particle_number, np.zeros(len(bonds)))
+    Qlm = coarse_grain_qlm(qlm, neighbour_csr.offset, neighbour_csr.index)
+    q, w = compute_ql_wl(qlm, l_input, l_offset, term_l, term_m, term_w3j)
+    Q, W = compute_ql_wl(Qlm, l_input, l_offset, term_l, term_m, term_w3j)
+    return q, w, Q, W
+
+
+def compute_boop(voronoi_bonds, points, radius, neighbour_list=None, l_list=(2, 4, 6, 8, 10)):
     # compute boo based on voronoi neighbour and cutoff neighbour
     # Reference: [1] Structure-property relationships from universal signatures of plasticity in disordered solids.
     #            [2] https://pyboo.readthedocs.io/en/latest/intro.html
+    # 列依次为 q_1, w_1, q_2, w_2, Q_1, W_1, Q_2, W_2，每组 len(l_list) 列，1 为 voronoi 邻域，2 为 3r 截断邻域
+    points = np.ascontiguousarray(points, dtype=np.float64)
     # step1. compute boo based on voronoi neighbour
-    bonds1 = []
-    for x in range(len(voronoi_neighbour)):
-        # 使用这种方法剔除了邻域不互相对称的颗粒，由剔除面积小于平均面积百分之五的邻域点所造成的不对称
-        for y in range(len(voronoi_neighbour[x])):
-            if voronoi_neighbour[x][y] > x:
-                bonds1.append([x, voronoi_neighbour[x][y]])
-    bonds1 = np.array(bonds1)
-    inside1 = np.array([True] * len(points))
-
-    q2m_1 = boo.bonds2qlm(points, bonds1, l=2)
-    q4m_1 = boo.bonds2qlm(points, bonds1, l=4)
-    q6m_1 = boo.bonds2qlm(points, bonds1, l=6)
-    q8m_1 = boo.bonds2qlm(points, bonds1, l=8)
-    q10m_1 = boo.bonds2qlm(points, bonds1, l=10)
-
-    Q2m_1, inside1_2_2 = boo.coarsegrain_qlm(q2m_1, bonds1, inside1)
-    Q4m_1, inside1_2_4 = boo.coarsegrain_qlm(q4m_1, bonds1, inside1)
-    Q6m_1, inside1_2_6 = boo.coarsegrain_qlm(q6m_1, bonds1, inside1)
-    Q8m_1, inside1_2_8 = boo.coarsegrain_qlm(q8m_1, bonds1, inside1)
-    Q10m_1, inside1_2_10 = boo.coarsegrain_qlm(q10m_1, bonds1, inside1)
-
-    q2_1 = boo.ql(q2m_1)
-    q4_1 = boo.ql(q4m_1)
-    q6_1 = boo.ql(q6m_1)
-    q8_1 = boo.ql(q8m_1)
-    q10_1 = boo.ql(q10m_1)
-
-    w2_1 = boo.wl(q2m_1)
-    w4_1 = boo.wl(q4m_1)
-    w6_1 = boo.wl(q6m_1)
-    w8_1 = boo.wl(q8m_1)
-    w10_1 = boo.wl(q10m_1)
-
-    Q2_1 = boo.ql(Q2m_1)
-    Q4_1 = boo.ql(Q4m_1)
-    Q6_1 = boo.ql(Q6m_1)
-    Q8_1 = boo.ql(Q8m_1)
-    Q10_1 = boo.ql(Q10m_1)
-
-    W2_1 = boo.wl(Q2m_1)
-    W4_1 = boo.wl(Q4m_1)
-    W6_1 = boo.wl(Q6m_1)
-    W8_1 = boo.wl(Q8m_1)
-    W10_1 = boo.wl(Q10m_1)
+    # voronoi_bonds 由 voronoi_bond 得到，剔除了邻域不互相对称的颗粒
+    q_1, w_1, Q_1, W_1 = compute_bond_orientational_order(points, voronoi_bonds, l_list)
     # step2. compute boo based on cutoff neighbour
     max_distance = 3.0 * radius[0]
-    kdtree = KDTree(points)
-    bonds2 = np.array(list(kdtree.query_pairs(max_distance)))
-    inside2 = np.array([True] * len(points))
-
-    q2m_2 = boo.bonds2qlm(points, bonds2, l=2)
-    q4m_2 = boo.bonds2qlm(points, bonds2, l=4)
-    q6m_2 = boo.bonds2qlm(points, bonds2, l=6)
-    q8m_2 = boo.bonds2qlm(points, bonds2, l=8)
-    q10m_2 = boo.bonds2qlm(points, bonds2, l=10)
-
-    Q2m_2, inside2_2_2 = boo.coarsegrain_qlm(q2m_2, bonds2, inside2)
-    Q4m_2, inside2_2_4 = boo.coarsegrain_qlm(q4m_2, bonds2, inside2)
-    Q6m_2, inside2_2_6 = boo.coarsegrain_qlm(q6m_2, bonds2, inside2)
-    Q8m_2, inside2_2_8 = boo.coarsegrain_qlm(q8m_2, bonds2, inside2)
-    Q10m_2, inside2_2_10 = boo.coarsegrain_qlm(q10m_2, bonds2, inside2)
-
-    q2_2 = boo.ql(q2m_2)
-    q4_2 = boo.ql(q4m_2)
-    q6_2 = boo.ql(q6m_2)
-    q8_2 = boo.ql(q8m_2)
-    q10_2 = boo.ql(q10m_2)
-
-    w2_2 = boo.wl(q2m_2)
-    w4_2 = boo.wl(q4m_2)
-    w6_2 = boo.wl(q6m_2)
-    w8_2 = boo.wl(q8m_2)
-    w10_2 = boo.wl(q10m_2)
-
-    Q2_2 = boo.ql(Q2m_2)
-    Q4_2 = boo.ql(Q4m_2)
-    Q6_2 = boo.ql(Q6m_2)
-    Q8_2 = boo.ql(Q8m_2)
-    Q10_2 = boo.ql(Q10m_2)
-
-    W2_2 = boo.wl(Q2m_2)
-    W4_2 = boo.wl(Q4m_2)
-    W6_2 = boo.wl(Q6m_2)
-    W8_2 = boo.wl(Q8m_2)
-    W10_2 = boo.wl(Q10m_2)
-
-    boop_all = np.array(list(zip(q2_1, q4_1, q6_1, q8_1, q10_1,
-                                 w2_1, w4_1, w6_1, w8_1, w10_1,
-                                 q2_2, q4_2, q6_2, q8_2, q10_2,
-                                 w2_2, w4_2, w6_2, w8_2, w10_2,
-                                 Q2_1, Q4_1, Q6_1, Q8_1, Q10_1,
-                                 W2_1, W4_1, W6_1, W8_1, W10_1,
-                                 Q2_2, Q4_2, Q6_2, Q8_2, Q10_2,
-                                 W2_2, W4_2, W6_2, W8_2, W10_2)))
-
+    if neighbour_list is None:
+        neighbour_list = build_neighbour_list(points, max_distance)
+    bonds2, distance2 = slice_neighbour_list(neighbour_list, max_distance)
+    q_2, w_2, Q_2, W_2 = compute_bond_orientational_order(points, bonds2, l_list)
+    boop_all = np.hstack((q_1, w_1, q_2, w_2, Q_1, W_1, Q_2, W_2))
     return boop_all
 
 
-def compute_cluster_packing_efficiency(voronoi_neighbour_use_input, points_input, radius_input):
-    # compute cluster packing efficiency
-    # Reference: Yang, L. et al. Atomic-scale mechanisms of the glass-forming ability in metallic glasses. Phys. Rev. Lett. 109, 105502 (2012).
-    cluster_packing_efficiency = np.zeros(shape=[len(voronoi_neighbour_use_input), ])
-    for a in range(len(voronoi_neighbour_use_input)):
-        if len(voronoi_neighbour_use_input[a]) >= 4:
-            points_now = []
-            radius_now = []
-            origin_particle = points_input[a]
-            origin_radius = radius_input[a]
-            for b in range(len(voronoi_neighbour_use_input[a])):
-                points_now.append(points_input[voronoi_neighbour_use_input[a][b]])
-                radius_now.append(radius_input[voronoi_neighbour_use_input[a][b]])
-            cpe_ch = ConvexHull(points_now)
-            cpe_simplice = np.array(cpe_ch.simplices)
-            interstice_volume_mid = np.zeros(shape=[len(cpe_simplice), ])
-            cluster_packing_efficiency_x = compute_cluster_packing_efficiency_single_particle(cpe_simplice,
-                                                                                              np.array(points_now),
-                                                                                              np.array(radius_now),
-                                                                                              interstice_volume_mid,
-                                                                                              origin_particle,
-                                                                                              origin_radius)
-
-            cluster_packing_efficiency[a] = cluster_packing_efficiency_x
-        else:
-            cluster_packing_efficiency[a] = 0.0
-    return cluster_packing_efficiency
-
-
-@jit(nopython=True)
-def compute_cluster_packing_efficiency_single_particle(simplice_input, points_now, radius_now, interstice_volume_mid,
-                                                       origin_particle, origin_radius):
-    triangle_volume_x = np.zeros_like(interstice_volume_mid)
-    pack_volume_x = np.zeros_like(interstice_volume_mid)
-    for b in range(len(simplice_input)):
-        volume_triangle = compute_tetrahedron_volume(points_now[simplice_input[b][0]],
-                                                     points_now[simplice_input[b][1]],
-                                                     points_now[simplice_input[b][2]],
-                                                     origin_particle)
-        volume_pack = (compute_solide_angle(origin_particle, points_now[simplice_input[b][0]],
-                                            points_now[simplice_input[b][1]],
-                                            points_now[simplice_input[b][2]])
-                       * origin_radius ** 3 +
-                       compute_solide_angle(points_now[simplice_input[b][2]], origin_particle,
-                                            points_now[simplice_input[b][0]], points_now[simplice_input[b][1]])
-                       * radius_now[simplice_input[b][2]] ** 3 +
-                       compute_solide_angle(points_now[simplice_input[b][1]],
-                                            points_now[simplice_input[b][2]], origin_particle,
-                                            points_now[simplice_input[b][0]])
-                       * radius_now[simplice_input[b][1]] ** 3 +
-                       compute_solide_angle(points_now[simplice_input[b][0]], points_now[simplice_input[b][1]],
-                                            points_now[simplice_input[b][2]], origin_particle) * radius_now[
-                           simplice_input[b][0]] ** 3) / 3
-        triangle_volume_x[b] = volume_triangle
-        pack_volume_x[b] = volume_pack
-    return np.sum(pack_volume_x) / np.sum(triangle_volume_x)
-
-
-@jit(nopython=True)
-def MRO(old_feature_SRO_array_input, boop_SRO_array_input, cpe_SRO_array_input, MRO_array_input, f_use_array_input,
-        voronoi_neighbour_input, neigh_id_length_index_input):
-    feature_MRO = np.empty_like(MRO_array_input)
-    for aa in range(18):
-        a = 5 * aa
-        feature_now = old_feature_SRO_array_input[:, aa]
-        for b in range(len(voronoi_neighbour_input)):
-            f_use_not = np.zeros_like(f_use_array_input)
-            for c in range(neigh_id_length_index_input[b]):
-                f_use_not[c] = feature_now[voronoi_neighbour_input[b][c]]
-            f_use = f_use_not[0: neigh_id_length_index_input[b]]
-            feature_MRO[a][b] = feature_now[b]
-            feature_MRO[a + 1][b] = np.min(f_use)
-            feature_MRO[a + 2][b] = np.max(f_use)
-            feature_MRO[a + 3][b] = np.mean(f_use)
-            mean = np.mean(f_use)
-            square = 0.0
-            for c in range(len(f_use)):
-                square += (f_use[c] - mean) ** 2
-            sqrt = math.sqrt((square / len(f_use)))
-            feature_MRO[a + 4][b] = sqrt
-    for aa in range(1):
-        a = (18 + aa) * 5
-        feature_now = cpe_SRO_array_input
-        for b in range(len(voronoi_neighbour_input)):
-            f_use_not = np.zeros_like(f_use_array_input)
-            for c in range(neigh_id_length_index_input[b]):
-                f_use_not[c] = feature_now[voronoi_neighbour_input[b][c]]
-            f_use = f_use_not[0: neigh_id_length_index_input[b]]
-            feature_MRO[a][b] = feature_now[b]
-            feature_MRO[a + 1][b] = np.min(f_use)
-            feature_MRO[a + 2][b] = np.max(f_use)
-            feature_MRO[a + 3][b] = np.mean(f_use)
-            mean = np.mean(f_use)
-            square = 0.0
-            for c in range(len(f_use)):
-                square += (f_use[c] - mean) ** 2
-            sqrt = math.sqrt((square / len(f_use)))
-            feature_MRO[a + 4][b] = sqrt
-    for aa in range(20):
-        a = (19 + aa) * 5
-        feature_now = boop_SRO_array_input[:, aa]
-        for b in range(len(voronoi_neighbour_input)):
-            f_use_not = np.zeros_like(f_use_array_input)
-            for c in range(neigh_id_length_index_input[b]):
-                f_use_not[c] = feature_now[voronoi_neighbour_input[b][c]]
-            f_use = f_use_not[0: neigh_id_length_index_input[b]]
-            feature_MRO[a][b] = feature_now[b]
-            feature_MRO[a + 1][b] = np.min(f_use)
-            feature_MRO[a + 2][b] = np.max(f_use)
-            feature_MRO[a + 3][b] = np.mean(f_use)
-            mean = np.mean(f_use)
-            square = 0.0
-            for c in range(len(f_use)):
-                square += (f_use[c] - mean) ** 2
-            sqrt = math.sqrt((square / len(f_use)))
-            feature_MRO[a + 4][b] = sqrt
-    for aa in range(20):
-        a = aa + 195
-        feature_now = boop_SRO_array_input[:, aa + 20]
-        for b in range(len(voronoi_neighbour_input)):
-            feature_MRO[a][b] = feature_now[b]
-    return feature_MRO
+def MRO(old_feature_SRO_array_input, boop_SRO_array_input, cpe_SRO_array_input, neigh_offset_input,
+        neigh_index_input, shell_csr=None):
+    # conventional feature (默认 18 列), cpe, boop 前一半 (q, w) 列依次为 self, min, max, mean, std，boop 后一半 (Q, W) 列只取 self
+    # shell_csr: 第 2, 3, ... 层邻域，每层在最后追加上述逐列统计的各列的 min, max, mean, std
+    boop_number = boop_SRO_array_input.shape[1] // 2
+    feature_SRO = np.hstack((old_feature_SRO_array_input, cpe_SRO_array_input.reshape(-1, 1),
+                             boop_SRO_array_input[:, :boop_number]))
+    return np.hstack([segment_reduce(feature_SRO, neigh_offset_input, neigh_index_input),
+                      boop_SRO_array_input[:, boop_number:]] + shell_reduce(feature_SRO, shell_csr))
 
 
 def zip_feature(Coordination_number_by_Voronoi_tessellation, Coordination_number_by_cutoff_distance,
-                Voronoi_idx, cellfraction, i_fold_symm, area_weight_i_fold_symm):
-    feature_all = np.array(list(zip(Coordination_number_by_Voronoi_tessellation,
-                                    Coordination_number_by_cutoff_distance,
-                                    Voronoi_idx['3'], Voronoi_idx['4'], Voronoi_idx['5'], Voronoi_idx['6'],
-                                    Voronoi_idx['7'],
-                                    cellfraction,
-                                    i_fold_symm['3'], i_fold_symm['4'], i_fold_symm['5'], i_fold_symm['6'],
-                                    i_fold_symm['7'],
-                                    area_weight_i_fold_symm['3'],
-                                    area_weight_i_fold_symm['4'],
-                                    area_weight_i_fold_symm['5'],
-                                    area_weight_i_fold_symm['6'],
-                                    area_weight_i_fold_symm['7'])))
+                face_order_histogram, cellfraction):
+    # 默认面阶数 3..7 时共 18 列: 两种配位数, voronoi index, cell fraction, i-fold symm, 面积加权 i-fold symm
+    feature_all = np.column_stack((Coordination_number_by_Voronoi_tessellation,
+                                   Coordination_number_by_cutoff_distance,
+                                   face_order_histogram.count,
+                                   cellfraction,
+                                   face_order_histogram.fraction,
+                                   face_order_histogram.area_fraction))
     return feature_all
 
 
-def compute_conventional_feature(points, area_all, neighbour, voronoi, radius):
+def compute_conventional_feature(points, tessellation, neighbour, radius, neighbour_list=None, hull_feature=None,
+                                 shell_csr=None, face_order_range=(3, 7), voronoi_bonds=None):
+    # hull_feature: compute_neighbour_hull_feature 的结果，None 时在此计算
+    # voronoi_bonds: voronoi_bond(neighbour) 的结果，给出时不再使用 neighbour
+    # shell_csr: build_shell_csr 得到的第 2, 3, ... 层 Voronoi 邻域，给出时追加这些层的 MRO
+    # face_order_range: voronoi index 与 i-fold symm 统计的面阶数范围
     # step1. set constant
     particle_number = len(points)
-    MRO_array = np.empty(shape=[215, particle_number])
-    f_use_array = np.empty(shape=[particle_number, ])
     # step1. modify voronoi neighbour information
-    voronoi_neighbour = []
-    for x in range(len(neighbour)):
-        voronoi_neighbour_now = []
-        for value in neighbour[x]:
-            if value >= 0:
-                voronoi_neighbour_now.append(value)
-        voronoi_neighbour.append(voronoi_neighbour_now)
-    bonds = []
-    for x in range(len(voronoi_neighbour)):
-        for y in range(len(voronoi_neighbour[x])):
-            if voronoi_neighbour[x][y] > x:
-                bonds.append([x, voronoi_neighbour[x][y]])
-    bonds = np.array(bonds)
-    voronoi_neighbour_use = []
-    for x in range(len(neighbour)):
-        voronoi_neighbour_use.append([])
-    for x in range(len(bonds)):
-        voronoi_neighbour_use[bonds[x][0]].append(bonds[x][1])
-        voronoi_neighbour_use[bonds[x][1]].append(bonds[x][0])
-    neigh_id_length_index = []
-    for x in range(len(voronoi_neighbour_use)):
-        neigh_id_length_index.append(len(voronoi_neighbour_use[x]))
-    neigh_id = np.zeros(shape=[particle_number, max(neigh_id_length_index)], dtype=int)
-    for x in range(len(voronoi_neighbour_use)):
-        for y in range(len(voronoi_neighbour_use[x])):
-            neigh_id[x][y] = int(voronoi_neighbour_use[x][y])
-    neigh_id_length_index = np.array(neigh_id_length_index)
+    bonds = voronoi_bond(neighbour) if voronoi_bonds is None else voronoi_bonds
+    voronoi_csr = build_bond_csr(bonds, particle_number, points=points)
+    if hull_feature is None:
+        hull_feature = compute_neighbour_hull_feature(voronoi_csr, points, radius)
     # step2. compute
     # 2.1 coordination number by voronoi tessellation
-    Coordination_number_by_Voronoi_tessellation = np.zeros(shape=[len(points), ])
-    for x in range(len(voronoi_neighbour_use)):
-        Coordination_number_by_Voronoi_tessellation[x] = len(voronoi_neighbour_use[x])
-    # 2.2 weighted i-fold symm
-    area_weight_i_fold_symm = compute_weight_i_fold_symm(voronoi, area_all)
+    Coordination_number_by_Voronoi_tessellation = np.diff(voronoi_csr.offset).astype(np.float64)
+    # 2.2 voronoi index, i-fold symm and weighted i-fold symm
+    face_order_histogram = compute_face_order_histogram(tessellation, face_order_range)
     # 2.3 coordination number by cutoff distance
-    Coordination_number_by_cutoff_distance = compute_coordination_number_by_cutoff_distance(points, radius)
+    Coordination_number_by_cutoff_distance = compute_coordination_number_by_cutoff_distance(points, radius,
+                                                                                            neighbour_list)
     # 2.4 cell fraction
-    cellfraction = compute_cellfraction(voronoi, radius)
-    # 2.5 voronoi index and i-fold symm
-    Voronoi_idx, i_fold_symm = compute_voronoi_idx(voronoi)
-    # 2.6 zip feature above
+    cellfraction = compute_cellfraction(tessellation, radius)
+    # 2.5 zip feature above
     feature_all = zip_feature(Coordination_number_by_Voronoi_tessellation, Coordination_number_by_cutoff_distance,
-                              Voronoi_idx, cellfraction, i_fold_symm, area_weight_i_fold_symm)
-    # 2.7 boop
-    boop_all = compute_boop(voronoi_neighbour, points, radius)
-    # 2.8 cluster packing efficiency
-    Cpe = compute_cluster_packing_efficiency(voronoi_neighbour_use, points, radius)
-    # 2.9 MRO
+                              face_order_histogram, cellfraction)
+    # 2.6 boop
+    boop_all = compute_boop(bonds, points, radius, neighbour_list)
+    # 2.7 cluster packing efficiency
+    Cpe = hull_feature.cluster_packing_efficiency
+    # 2.8 MRO
     old_feature_SRO_array = feature_all
     boop_SRO_array = boop_all
     cpe_SRO_array = Cpe
-    feature_MRO_out = MRO(old_feature_SRO_array, boop_SRO_array, cpe_SRO_array, MRO_array, f_use_array, neigh_id,
-                          neigh_id_length_index)
-    return feature_MRO_out.T
+    feature_MRO_out = MRO(old_feature_SRO_array, boop_SRO_array, cpe_SRO_array, voronoi_csr.offset,
+                          voronoi_csr.index, shell_csr)
+    return feature_MRO_out
 
 
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
 
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+def read_dump_frame(stream):
+    # 从数据流的当前位置读取一帧 LAMMPS dump 数据，按颗粒 id 排序
+    # 只解析 ITEM: ATOMS 表头一次，然后一次性读入 id/radius/x/y/z 五列
+    # step1. header
+    timestep = None
+    particle_number = None
+    columns = None
+    while columns is None:
+        line = stream.readline()
+        if not line:
+            raise EOFError('unexpected end of dump file')
+        if isinstance(line, bytes):
+            line = line.decode()
+        if line.startswith('ITEM: TIMESTEP'):
+            timestep = int(stream.readline())
+        elif line.startswith('ITEM: NUMBER OF ATOMS'):
+            particle_number = int(stream.readline())
+        elif line.startswith('ITEM: ATOMS'):
+            columns = line.split()[2:]
+    if particle_number is None:
+        raise ValueError('dump frame has no ITEM: NUMBER OF ATOMS section')
+    # step2. column index of id, radius, x, y, z
+    # 表头缺少列名时沿用旧的固定列位置: id type radius x y z
+    if all(name in columns for name in ['id', 'radius', 'x', 'y', 'z']):
+        use_columns = [columns.index(name) for name in ['id', 'radius', 'x', 'y', 'z']]
+    else:
+        use_columns = [0, 2, 3, 4, 5]
+    # step3. read the atoms section in one pass
+    data = np.loadtxt(itertools.islice(stream, particle_number), usecols=use_columns, ndmin=2)
+    if len(data) != particle_number:
+        raise EOFError('dump frame is truncated: %d of %d atoms' % (len(data), particle_number))
+    # step4. sort by particle id
+    order = np.argsort(data[:, 0], kind='stable')
+    Par_id = data[order, 0].astype(np.int64)
+    Par_radius = np.ascontiguousarray(data[order, 1])
+    Par_coord = np.ascontiguousarray(data[order, 2:5])
+    boundary = compute_boundary(Par_coord, Par_radius)
+    return timestep, Par_id, Par_coord, Par_radius, boundary
+
+
+def compute_boundary(Par_coord, Par_radius):
+    # 由颗粒坐标确定 voronoi 划分的长方体边界
+    x_min = float('%.4f' % (np.min(Par_coord[:, 0]) - Par_radius[0]))
+    x_max = float('%.4f' % (np.max(Par_coord[:, 0]) + Par_radius[0]))
+    y_min = float('%.4f' % (np.min(Par_coord[:, 1]) - Par_radius[0]))
+    y_max = float('%.4f' % (np.max(Par_coord[:, 1]) + Par_radius[0]))
+    z_min = float('%.4f' % (np.min(Par_coord[:, 2]) - Par_radius[0]))
+    z_max = float(np.max(Par_coord[:, 2]) + Par_radius[0])
+    boundary = [[x_min, x_max], [y_min, y_max], [z_min, z_max]]
+    return boundary
+
+
 def read_position_information(dump_path, frame):
     # 读取颗粒位置信息
-    particle_info = open(dump_path + '/dump-' + str(frame) + '.sample', 'r')
-    lines = particle_info.readlines()
-    particle_info.close()
-    lines = lines[9:]
-    Par_id = list(map(int, map(float, [re.findall(r'-?\d+\.?\d*e?[-+]?\d*', line)[0] for line in lines])))
-    Par_id_read = list(map(int, map(float, [re.findall(r'-?\d+\.?\d*e?[-+]?\d*', line)[0] for line in lines])))
-    Par_xcor_read = list(map(float, [re.findall(r'-?\d+\.?\d*e?[-+]?\d*', line)[3] for line in lines]))
-    Par_ycor_read = list(map(float, [re.findall(r'-?\d+\.?\d*e?[-+]?\d*', line)[4] for line in lines]))
-    Par_zcor_read = list(map(float, [re.findall(r'-?\d+\.?\d*e?[-+]?\d*', line)[5] for line in lines]))
-    Par_radius_read = list(map(float, [re.findall(r'-?\d+\.?\d*e?[-+]?\d*', line)[2] for line in lines]))
-    Par_id.sort()
-    Par_xcor = [Par_xcor_read[Par_id_read.index(Par_id[x])] for x in range(len(Par_id))]
-    Par_ycor = [Par_ycor_read[Par_id_read.index(Par_id[x])] for x in range(len(Par_id))]
-    Par_zcor = [Par_zcor_read[Par_id_read.index(Par_id[x])] for x in range(len(Par_id))]
-    Par_radius = [Par_radius_read[Par_id_read.index(Par_id[x])] for x in range(len(Par_id))]
-    Par_coord = np.array(list(zip(Par_xcor, Par_ycor, Par_zcor)))
-    x_min = float('%.4f' % (np.min(Par_xcor) - Par_radius[0]))
-    x_max = float('%.4f' % (np.max(Par_xcor) + Par_radius[0]))
-    y_min = float('%.4f' % (np.min(Par_ycor) - Par_radius[0]))
-    y_max = float('%.4f' % (np.max(Par_ycor) + Par_radius[0]))
-    z_min = float('%.4f' % (np.min(Par_zcor) - Par_radius[0]))
-    z_max = np.max(Par_zcor) + Par_radius[0]
-    boundary = [[x_min, x_max], [y_min, y_max], [z_min, z_max]]
+    with open(dump_path + '/dump-' + str(frame) + '.sample', 'rb') as particle_info:
+        timestep, Par_id, Par_coord, Par_radius, boundary = read_dump_frame(particle_info)
     return Par_coord, Par_radius, boundary
 
 
-def compute_area(vertices_input, adjacent_cell_input, vertices_id_input, simplice_input):
-    area_judge_in = np.zeros(shape=[len(adjacent_cell_input), ], dtype=int)
-    area_in = np.zeros(shape=[len(adjacent_cell_input), ])
-    sing_area = np.zeros(shape=[len(simplice_input), ])
-    for a in range(len(simplice_input)):
-        sing_area[a] = compute_simplice_area(vertices_input[simplice_input[a][0]],
-                                             vertices_input[simplice_input[a][1]],
-                                             vertices_input[simplice_input[a][2]])
-    for a in range(len(simplice_input)):
-        for b in range(len(adjacent_cell_input)):
-            if simplice_input[a][0] in vertices_id_input[b]:
-                if simplice_input[a][1] in vertices_id_input[b]:
-                    if simplice_input[a][2] in vertices_id_input[b]:
-                        area_in[b] += sing_area[a]
-    average_area = np.mean(area_in)
-    for a in range(len(adjacent_cell_input)):
-        if area_in[a] >= 0.05 * average_area:
-            area_judge_in[a] = 1
-    return area_judge_in, area_in
-
-
-def eliminate_useless_adjacent_cell(voronoi):
-    # 剔除面积小于平均面积百分之五的邻域点,这可能会造成互为邻域颗粒之间的不对称，后面的程序需要逐一处理
-    adjacent_cell_all = []
-    area_all_particle = []
-    for x in range(len(voronoi)):
-        vertices = voronoi[x]['vertices']
-        ch = ConvexHull(vertices)
-        simplice = np.array(ch.simplices)
-        faces = voronoi[x]['faces']
-        adjacent_cell = []
-        for y in range(len(faces)):
-            adjacent_cell.append(faces[y]['adjacent_cell'])
-        vert_id = []
-        for y in range(len(faces)):
-            vert_id.append(faces[y]['vertices'])
-        area_judge, area = compute_area(vertices, adjacent_cell, vert_id, simplice)
-        adjacent_cell_use = []
-        for y in range(len(adjacent_cell)):
-            if area_judge[y] == 1:
-                adjacent_cell_use.append(adjacent_cell[y])
-        adjacent_cell_all.append(adjacent_cell_use)
-        area_all_particle.append(area)
-    return adjacent_cell_all, area_all_particle
-
-
-def compute_voronoi_neighbour(points, radius, limits):
+def frame_cache_path(source_file, frame):
+    # 帧缓存放在 dump 目录下的 frame cache 子目录中
+    cache_dir = os.path.join(os.path.dirname(source_file), 'frame cache')
+    return os.path.join(cache_dir, os.path.basename(source_file) + '.' + str(frame))
+
+
+# 写入失败的缓存目录，每个目录只提示一次
+FRAME_CACHE_FAILED = set()
+
+
+def write_frame_cache(source_file, frame, Par_id, Par_coord, Par_radius, boundary):
+    # 缓存是可选的: dump 目录只读或磁盘已满时提示一次，不写缓存继续计算
+    cache_path = frame_cache_path(source_file, frame)
+    try:
+        save_frame_cache(cache_path, source_file, frame, Par_id, Par_coord, Par_radius, boundary)
+    except OSError as error:
+        cache_dir = os.path.dirname(cache_path)
+        if cache_dir not in FRAME_CACHE_FAILED:
+            FRAME_CACHE_FAILED.add(cache_dir)
+            print('frame cache is not written to %s (%s), continuing without it' % (cache_dir, error))
+
+
+def save_frame_cache(cache_path, source_file, frame, Par_id, Par_coord, Par_radius, boundary):
+    # 把排序后的 id、坐标、半径写成 .npy，边界和源文件的 mtime/size 写入 .json
+    # .json 最后写入，只有它存在时缓存才被认为是完整的
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    source_stat = os.stat(source_file)
+    for name, array in [['id', Par_id], ['coord', Par_coord], ['radius', Par_radius]]:
+        with open(cache_path + '.' + name + '.npy.tmp', 'wb') as cache_file:
+            np.save(cache_file, np.ascontiguousarray(array))
+        os.replace(cache_path + '.' + name + '.npy.tmp', cache_path + '.' + name + '.npy')
+    meta = {'frame': int(frame),
+            'particle_number': len(Par_coord),
+            'source_size': source_stat.st_size,
+            'source_mtime_ns': source_stat.st_mtime_ns,
+            'boundary': boundary}
+    with open(cache_path + '.json.tmp', 'w') as cache_file:
+        json.dump(meta, cache_file)
+    os.replace(cache_path + '.json.tmp', cache_path + '.json')
+
+
+def read_frame_cache(source_file, frame):
+    # 源文件的 mtime 或 size 变化后缓存失效，返回 None
+    cache_path = frame_cache_path(source_file, frame)
+    try:
+        with open(cache_path + '.json', 'r') as cache_file:
+            meta = json.load(cache_file)
+        source_stat = os.stat(source_file)
+        if meta['source_size'] != source_stat.st_size or meta['source_mtime_ns'] != source_stat.st_mtime_ns:
+            return None
+        Par_id = np.load(cache_path + '.id.npy', mmap_mode='r')
+        Par_coord = np.load(cache_path + '.coord.npy', mmap_mode='r')
+        Par_radius = np.load(cache_path + '.radius.npy', mmap_mode='r')
+    except (OSError, ValueError, KeyError):
+        return None
+    if len(Par_coord) != meta['particle_number']:
+        return None
+    return Par_id, Par_coord, Par_radius, meta['boundary']
+
+
+class ZstdDumpStream(io.RawIOBase):
+    # zstandard 的解压流只支持向前 seek 且没有 readline，包装后交给 io.BufferedReader
+    def __init__(self, source_file):
+        super().__init__()
+        self.reader = zstandard.ZstdDecompressor().stream_reader(open(source_file, 'rb'), closefd=True)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        return self.reader.readinto(buffer)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        return self.reader.seek(offset, whence)
+
+    def tell(self):
+        return self.reader.tell()
+
+    def close(self):
+        if not self.closed:
+            self.reader.close()
+        super().close()
+
+
+def open_dump_file(source_file):
+    # 按扩展名打开 dump 文件，.gz/.xz/.zst 边读边解压，不产生临时文件
+    if source_file.endswith('.gz'):
+        return gzip.open(source_file, 'rb')
+    if source_file.endswith('.xz'):
+        return lzma.open(source_file, 'rb')
+    if source_file.endswith('.zst'):
+        if zstandard is None:
+            raise ImportError('reading .zst dump files requires the zstandard package')
+        return io.BufferedReader(ZstdDumpStream(source_file), buffer_size=1 << 20)
+    return open(source_file, 'rb')
+
+
+def read_dump_source(source_file, frame, offset=0, frame_cache=False):
+    # 从 source_file 的字节偏移 offset 处读取一帧，frame_cache=True 时优先从二进制缓存 mmap 读取
+    # 返回 (id, coord, radius, boundary)
+    if frame_cache:
+        cached = read_frame_cache(source_file, frame)
+        if cached is not None:
+            return cached
+    with open_dump_file(source_file) as particle_info:
+        particle_info.seek(offset)
+        timestep, Par_id, Par_coord, Par_radius, boundary = read_dump_frame(particle_info)
+    if frame_cache:
+        write_frame_cache(source_file, frame, Par_id, Par_coord, Par_radius, boundary)
+    return Par_id, Par_coord, Par_radius, boundary
+
+
+def dump_source_file(dump_path, frame):
+    # dump-<frame>.sample 及其压缩形式 .sample.gz/.sample.xz/.sample.zst
+    source_file = dump_path + '/dump-' + str(frame) + '.sample'
+    for suffix in ['', '.gz', '.xz', '.zst']:
+        if os.path.exists(source_file + suffix):
+            return source_file + suffix
+    return source_file
+
+
+def load_position_information(dump_path, frame, frame_cache=False):
+    # 读取 dump-<frame>.sample 中的颗粒位置信息
+    Par_id, Par_coord, Par_radius, boundary = read_dump_source(dump_source_file(dump_path, frame), frame, 0,
+                                                               frame_cache)
+    return Par_coord, Par_radius, boundary
+
+
+def index_dump_timestep(dump_file, chunk_size=1 << 24):
+    # 扫描一次多帧 dump 文件，记录每个 ITEM: TIMESTEP 所在的字节偏移 {timestep: offset}
+    # 按块读取并用 bytes.find 查找，不逐行解析原子数据
+    marker = b'ITEM: TIMESTEP'
+    dump_index = {}
+    offset = 0
+    buffer = b''
+    with open_dump_file(dump_file) as stream:
+        while True:
+            chunk = stream.read(chunk_size)
+            buffer = buffer + chunk
+            search = 0
+            while True:
+                found = buffer.find(marker, search)
+                if found < 0:
+                    keep = max(search, len(buffer) - len(marker))
+                    break
+                # 时间步数值在标记行的下一行; 标记行可能以 \r\n 结尾或带有行尾空格
+                line_end = buffer.find(b'\n', found + len(marker))
+                value_end = buffer.find(b'\n', line_end + 1) if line_end >= 0 else -1
+                if value_end < 0:
+                    if chunk:
+                        # 时间步数值跨越了块的边界，等下一块再解析
+                        keep = found
+                        break
+                    if line_end < 0:
+                        keep = found
+                        break
+                    value_end = len(buffer)
+                value = buffer[line_end + 1:value_end].strip()
+                if value:
+                    dump_index[int(value)] = offset + found
+                search = value_end
+            if not chunk:
+                break
+            offset += keep
+            buffer = buffer[keep:]
+    if not dump_index:
+        raise ValueError('no ITEM: TIMESTEP found in dump file %s' % dump_file)
+    return dump_index
+
+
+def iter_dump_timestep(dump_file, frame_list, dump_index=None, frame_cache=False):
+    # 多帧 dump 文件: 按 frame_list 顺序定位到对应时间步，惰性地产生 (frame, id, coord, radius, boundary)
+    # 整个过程只打开一次文件，压缩文件按时间步顺序向前 seek 时只解压一遍
+    if dump_index is None:
+        dump_index = index_dump_timestep(dump_file)
+    with open_dump_file(dump_file) as stream:
+        for frame in frame_list:
+            if frame not in dump_index:
+                print('timestep %d is not in %s' % (frame, dump_file))
+                continue
+            cached = read_frame_cache(dump_file, frame) if frame_cache else None
+            if cached is not None:
+                Par_id, Par_coord, Par_radius, boundary = cached
+            else:
+                stream.seek(dump_index[frame])
+                timestep, Par_id, Par_coord, Par_radius, boundary = read_dump_frame(stream)
+                if frame_cache:
+                    write_frame_cache(dump_file, frame, Par_id, Par_coord, Par_radius, boundary)
+            yield frame, Par_id, Par_coord, Par_radius, boundary
+
+
+def iter_dump_directory(dump_path, frame_list, frame_cache=False):
+    # 每帧一个 dump-<frame>.sample 文件: 惰性地产生 (frame, id, coord, radius, boundary)
+    for frame in frame_list:
+        Par_id, Par_coord, Par_radius, boundary = read_dump_source(dump_source_file(dump_path, frame), frame, 0,
+                                                                   frame_cache)
+        yield frame, Par_id, Par_coord, Par_radius, boundary
+
+
+def flatten_voronoi_face(voronoi):
+    # 把 pyvoro 输出的每个 cell 展平为一张面表
+    # vertices: 所有 cell 的顶点坐标; face_vertex_offset/face_vertex_id: 每个面的有序顶点环 (CSR, 全局顶点编号)
+    # cell_vertex_number / cell_face_number: 每个 cell 的顶点数、面数; face_adjacent_cell: 每个面的相邻 cell
+    particle_number = len(voronoi)
+    cell_vertex_number = np.array([len(voronoi[x]['vertices']) for x in range(particle_number)], dtype=np.int64)
+    cell_face_number = np.array([len(voronoi[x]['faces']) for x in range(particle_number)], dtype=np.int64)
+    vertices = np.array(list(itertools.chain.from_iterable(voronoi[x]['vertices'] for x in range(particle_number))),
+                        dtype=np.float64)
+    faces = list(itertools.chain.from_iterable(voronoi[x]['faces'] for x in range(particle_number)))
+    face_vertex_number = np.array([len(face['vertices']) for face in faces], dtype=np.int64)
+    face_adjacent_cell = np.array([face['adjacent_cell'] for face in faces], dtype=np.int64)
+    face_vertex_id = np.fromiter(itertools.chain.from_iterable(face['vertices'] for face in faces),
+                                 dtype=np.int64, count=int(np.sum(face_vertex_number)))
+    # cell 内的顶点编号转为全局编号
+    face_cell = np.repeat(np.arange(particle_number), cell_face_number)
+    cell_vertex_offset = np.concatenate(([0], np.cumsum(cell_vertex_number)[:-1]))
+    face_vertex_id += np.repeat(cell_vertex_offset[face_cell], face_vertex_number)
+    face_vertex_offset = np.concatenate(([0], np.cumsum(face_vertex_number)))
+    return vertices, cell_vertex_number, face_vertex_offset, face_vertex_id, cell_face_number, face_adjacent_cell
+
+
+@jit(nopython=True, nogil=True, cache=True)
+def compute_face_area(vertices, face_vertex_offset, face_vertex_id):
+    # 由有序的面顶点环直接计算多边形面积: 以第一个顶点为中心做扇形三角剖分，叉积求和
+    face_area = np.empty(len(face_vertex_offset) - 1)
+    for a in range(len(face_vertex_offset) - 1):
+        origin = vertices[face_vertex_id[face_vertex_offset[a]]]
+        sx = 0.0
+        sy = 0.0
+        sz = 0.0
+        for b in range(face_vertex_offset[a] + 1, face_vertex_offset[a + 1] - 1):
+            v1 = vertices[face_vertex_id[b]]
+            v2 = vertices[face_vertex_id[b + 1]]
+            e1x = v1[0] - origin[0]
+            e1y = v1[1] - origin[1]
+            e1z = v1[2] - origin[2]
+            e2x = v2[0] - origin[0]
+            e2y = v2[1] - origin[1]
+            e2z = v2[2] - origin[2]
+            sx += e1y * e2z - e1z * e2y
+            sy += e1z * e2x - e1x * e2z
+            sz += e1x * e2y - e1y * e2x
+        face_area[a] = 0.5 * math.sqrt(sx ** 2 + sy ** 2 + sz ** 2)
+    return face_area
+
+
+# 每帧构建一次的 voronoi 划分，全部以数组保存，各类 voronoi 特征都从这里读取
+# volume: 每个 cell 的体积 (N)
+# cell_face_offset: 第 x 个 cell 的面为 cell_face_offset[x]:cell_face_offset[x + 1] (N + 1)
+# face_vertex_number / face_area / face_adjacent_cell: 每个面的边数、面积、相邻 cell (负数为边界)
+# face_judge: 面积不小于所属 cell 平均面积百分之五的面
+VoronoiTessellation = namedtuple('VoronoiTessellation', ['volume', 'cell_face_offset', 'face_vertex_number',
+                                                         'face_area', 'face_adjacent_cell', 'face_judge'])
+
+
+def build_voronoi_tessellation(voronoi):
+    # 由 pyvoro 的输出构建 VoronoiTessellation，之后不再需要 pyvoro 的 dict
+    volume = np.array([voronoi[x]['volume'] for x in range(len(voronoi))], dtype=np.float64)
+    vertices, cell_vertex_number, face_vertex_offset, face_vertex_id, cell_face_number, face_adjacent_cell = \
+        flatten_voronoi_face(voronoi)
+    face_area = compute_face_area(vertices, face_vertex_offset, face_vertex_id)
+    return assemble_voronoi_tessellation(volume, cell_face_number, np.diff(face_vertex_offset), face_area,
+                                         face_adjacent_cell)
+
+
+def assemble_voronoi_tessellation(volume, cell_face_number, face_vertex_number, face_area, face_adjacent_cell):
+    # 由按 cell 排列的面表构建 VoronoiTessellation，并标记面积不小于平均面积百分之五的面
+    cell_face_offset = np.concatenate(([0], np.cumsum(cell_face_number)))
+    average_area = np.add.reduceat(face_area, cell_face_offset[:-1]) / cell_face_number
+    face_judge = face_area >= 0.05 * np.repeat(average_area, cell_face_number)
+    return VoronoiTessellation(volume=volume,
+                               cell_face_offset=cell_face_offset,
+                               face_vertex_number=face_vertex_number,
+                               face_area=face_area,
+                               face_adjacent_cell=face_adjacent_cell,
+                               face_judge=face_judge)
+
+
+def voronoi_block_number(limits, workers):
+    # 子区域划分: 每次把当前最长的方向加倍，直到子区域数不少于进程数
+    length = np.array([limits[x][1] - limits[x][0] for x in range(3)], dtype=np.float64)
+    block_number = np.ones(3, dtype=np.int64)
+    while np.prod(block_number) < workers:
+        block_number[np.argmax(length / block_number)] *= 2
+    return block_number
+
+
+def tessellate_block(points_block, block_id_global, owned_local, limits_block, interior_side, dispersion):
+    # 对一个子区域及其 ghost 颗粒做 voronoi 划分，只返回区域内颗粒的 cell，邻域编号换成全局编号
+    # cell 的外接半径为 R 时，只要颗粒到内部（非样品边界）halo 边界的距离大于 2R，该 cell 与整体划分的结果相同
+    # 有 cell 不满足该条件时返回 None，由调用方加大 halo 后重算
+    voronoi = pyvoro.compute_voronoi(points_block, limits_block, dispersion, periodic=[False] * 3)
+    owned_cell = [voronoi[x] for x in owned_local]
+    volume = np.array([owned_cell[x]['volume'] for x in range(len(owned_cell))], dtype=np.float64)
+    vertices, cell_vertex_number, face_vertex_offset, face_vertex_id, cell_face_number, face_adjacent_cell = \
+        flatten_voronoi_face(owned_cell)
+    owned_points = points_block[owned_local]
+    vertex_distance = np.linalg.norm(vertices - np.repeat(owned_points, cell_vertex_number, axis=0), axis=1)
+    cell_radius = np.maximum.reduceat(vertex_distance, np.concatenate(([0], np.cumsum(cell_vertex_number)[:-1])))
+    for x in range(3):
+        if interior_side[x][0] and np.any(owned_points[:, x] - limits_block[x][0] <= 2 * cell_radius):
+            return None
+        if interior_side[x][1] and np.any(limits_block[x][1] - owned_points[:, x] <= 2 * cell_radius):
+            return None
+    face_area = compute_face_area(vertices, face_vertex_offset, face_vertex_id)
+    wall = face_adjacent_cell < 0
+    face_adjacent_cell = np.where(wall, face_adjacent_cell, block_id_global[np.where(wall, 0, face_adjacent_cell)])
+    return (block_id_global[owned_local], volume, cell_face_number, np.diff(face_vertex_offset), face_area,
+            face_adjacent_cell)
+
+
+def voronoi_executor(workers):
+    # voronoi 子区域划分的进程池，每次运行只建一次，各帧复用（spawn 的 worker 启动时要重新导入整个脚本）
+    # spawn: 主进程运行过 numba parallel 核之后已有其线程池，fork 出的 worker 可能死锁
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+
+
+def compute_voronoi_tessellation_parallel(points, limits, dispersion, workers, halo_width, executor):
+    # 按空间子区域并行计算 voronoi 划分，每个子区域带 halo_width 厚的 ghost 颗粒，结果按颗粒编号合并
+    # executor: voronoi_executor(workers) 得到的进程池
+    points = np.ascontiguousarray(points, dtype=np.float64)
+    lower = np.array([limits[x][0] for x in range(3)], dtype=np.float64)
+    upper = np.array([limits[x][1] for x in range(3)], dtype=np.float64)
+    block_number = voronoi_block_number(limits, workers)
+    block_width = (upper - lower) / block_number
+    block_index = np.clip(np.floor((points - lower) / block_width).astype(np.int64), 0, block_number - 1)
+    block_flat = np.ravel_multi_index(block_index.T, block_number)
+    pending = [[block, halo_width] for block in range(int(np.prod(block_number))) if np.any(block_flat == block)]
+    result_all = []
+    while pending:
+        futures = []
+        for block, halo in pending:
+            block_lower = lower + np.array(np.unravel_index(block, block_number)) * block_width
+            block_upper = block_lower + block_width
+            halo_lower = np.maximum(block_lower - halo, lower)
+            halo_upper = np.minimum(block_upper + halo, upper)
+            interior_side = [[bool(halo_lower[x] > lower[x]), bool(halo_upper[x] < upper[x])] for x in range(3)]
+            # 内部边界上的颗粒不放入子区域，避免落在容器壁上
+            inside = np.ones(len(points), dtype=bool)
+            for x in range(3):
+                inside &= (points[:, x] > halo_lower[x]) if interior_side[x][0] else (points[:, x] >= lower[x])
+                inside &= (points[:, x] < halo_upper[x]) if interior_side[x][1] else (points[:, x] <= upper[x])
+            inside |= block_flat == block
+            block_id_global = np.nonzero(inside)[0]
+            owned_local = np.nonzero(block_flat[block_id_global] == block)[0]
+            limits_block = [[min(halo_lower[x], np.min(points[block_id_global, x])),
+                             max(halo_upper[x], np.max(points[block_id_global, x]))] for x in range(3)]
+            futures.append([block, halo, executor.submit(tessellate_block, points[block_id_global],
+                                                         block_id_global, owned_local, limits_block,
+                                                         interior_side, dispersion)])
+        pending = []
+        for block, halo, future in futures:
+            result = future.result()
+            if result is None:
+                pending.append([block, 2 * halo])
+            else:
+                result_all.append(result)
+    # 合并: 按全局颗粒编号重排 cell 及其面
+    cell_id = np.concatenate([result[0] for result in result_all])
+    volume = np.concatenate([result[1] for result in result_all])
+    cell_face_number = np.concatenate([result[2] for result in result_all])
+    face_vertex_number = np.concatenate([result[3] for result in result_all])
+    face_area = np.concatenate([result[4] for result in result_all])
+    face_adjacent_cell = np.concatenate([result[5] for result in result_all])
+    order = np.argsort(cell_id)
+    face_start = np.concatenate(([0], np.cumsum(cell_face_number)[:-1]))[order]
+    cell_face_number = cell_face_number[order]
+    face_order = np.arange(np.sum(cell_face_number)) + np.repeat(
+        face_start - np.concatenate(([0], np.cumsum(cell_face_number)[:-1])), cell_face_number)
+    return assemble_voronoi_tessellation(volume[order], cell_face_number, face_vertex_number[face_order],
+                                         face_area[face_order], face_adjacent_cell[face_order])
+
+
+def eliminate_useless_adjacent_cell(tessellation):
+    # 剔除面积小于平均面积百分之五的邻域点,这可能会造成互为邻域颗粒之间的不对称，由 voronoi_bond 消除
+    # 返回 CSR 邻域，第 x 个 cell 保留的相邻 cell 为 index[offset[x]:offset[x + 1]]，顺序与面的顺序相同
+    particle_number = len(tessellation.cell_face_offset) - 1
+    row = np.repeat(np.arange(particle_number), np.diff(tessellation.cell_face_offset))
+    offset = np.concatenate(([0], np.cumsum(np.bincount(row[tessellation.face_judge], minlength=particle_number))))
+    return NeighbourCSR(offset=offset, index=tessellation.face_adjacent_cell[tessellation.face_judge], distance=None)
+
+
+def compute_voronoi_neighbour(points, radius, limits, workers=1, halo_width=None, executor=None):
+    # workers > 1 时按空间子区域在进程池中并行划分，halo_width 默认取 dispersion，不够时自动加倍
+    # executor: 多帧计算时传入同一个 voronoi_executor(workers)，None 时只为这一帧建进程池
     dispersion = 5 * radius[0]
-    voronoi = pyvoro.compute_voronoi(points, limits, dispersion, periodic=[False] * 3)
-    neighbour, area = eliminate_useless_adjacent_cell(voronoi)
-    return voronoi, neighbour, area
+    if workers > 1:
+        if halo_width is None:
+            halo_width = dispersion
+        if executor is None:
+            with voronoi_executor(workers) as executor:
+                tessellation = compute_voronoi_tessellation_parallel(points, limits, dispersion, workers,
+                                                                     halo_width, executor)
+        else:
+            tessellation = compute_voronoi_tessellation_parallel(points, limits, dispersion, workers, halo_width,
+                                                                 executor)
+    else:
+        voronoi = pyvoro.compute_voronoi(points, limits, dispersion, periodic=[False] * 3)
+        tessellation = build_voronoi_tessellation(voronoi)
+    neighbour = eliminate_useless_adjacent_cell(tessellation)
+    return tessellation, neighbour
 
 
-def main_function(path, path_output, scenario):
-    # dump files
-    mkdir(path_output)
-    dump_path = path
+def list_dump_frame(dump_path):
+    # dump-<frame>.sample（可为 .gz/.xz/.zst 压缩）文件对应的帧号，升序
     list_dir = os.listdir(dump_path)
     dump_frame = []
     file_prefix = 'dump-'
     file_suffix = '.sample'
     prefix_len = len(file_prefix)
-    suffix_len = len(file_suffix)
     for file in list_dir:
-        dump_frame.append(int(file[prefix_len:][:-suffix_len]))
-    dump_frame = sorted(dump_frame)
+        for suffix in [file_suffix, file_suffix + '.gz', file_suffix + '.xz', file_suffix + '.zst']:
+            if file.startswith(file_prefix) and file.endswith(suffix):
+                dump_frame.append(int(file[prefix_len:][:-len(suffix)]))
+    dump_frame = sorted(set(dump_frame))
+    return dump_frame
+
+
+def prefetch_frame(frames):
+    # 后台线程提前读取（解压、解析）下一帧，与当前帧的特征计算重叠
+    frames = iter(frames)
+    end = object()
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(next, frames, end)
+        while True:
+            item = future.result()
+            if item is end:
+                break
+            future = executor.submit(next, frames, end)
+            yield item
+
+
+def select_frame(dump_frame, scenario):
+    # 在首帧与末帧之间等间隔地选出 scenario 段，返回帧号（含首末帧）
     start_frame = np.min(dump_frame)
     end_frame = np.max(dump_frame)
     frame_interval = (end_frame - start_frame) / scenario
     frame_list = np.arange(start_frame, end_frame, frame_interval)
     frame_list = np.append(frame_list, end_frame)
     frame_list = frame_list.astype(int)
+    return frame_list
+
+
+# 特征输出: 三类特征各为一张带列名的表，每行一个颗粒
+FEATURE_FAMILY = ['symmetry feature', 'interstice distribution', 'conventional feature']
+MRO_STATISTIC = ['min', 'max', 'mean', 'std']
+
+
+def mro_feature_name(feature_name, shell_number=1):
+    # 与 segment_reduce 的列顺序相同: 每列的 self 与第一层邻域的 min, max, mean, std
+    # shell_number > 1 时另返回 shell_reduce 追加的第 2.. 层邻域的列名
+    name = []
+    for x in feature_name:
+        name += [x] + ['%s_shell1_%s' % (x, stat) for stat in MRO_STATISTIC]
+    shell_name = []
+    for k in range(2, shell_number + 1):
+        for x in feature_name:
+            shell_name += ['%s_shell%d_%s' % (x, k, stat) for stat in MRO_STATISTIC]
+    return name, shell_name
+
+
+def feature_column_name(symmetry_parameter=None, shell_number=1, face_order_range=(3, 7), l_list=(2, 4, 6, 8, 10)):
+    # 三类特征的列名，与 compute_symmetry_functions, compute_interstice_distribution, compute_conventional_feature 的列对应
+    if symmetry_parameter is None:
+        symmetry_parameter = DEFAULT_SYMMETRY_PARAMETER
+    # symmetry feature: 角向 G4 与径向 G2，参数以颗粒半径为单位
+    symmetry_name = (['G4_a%g_b%g_c%g' % tuple(row) for row in symmetry_parameter.angular]
+                     + ['G2_r%g' % centre for centre in symmetry_parameter.radial_centre])
+    # interstice distribution
+    interstice_SRO = (['interstice_distance_%s' % stat for stat in MRO_STATISTIC]
+                      + ['interstice_%s_%s' % (kind, stat) for kind in ['area', 'volume'] for stat in MRO_STATISTIC])
+    interstice_name, interstice_shell_name = mro_feature_name(interstice_SRO, shell_number)
+    # conventional feature, boop 的 1 为 voronoi 邻域，2 为 3r 截断邻域
+    order = range(face_order_range[0], face_order_range[1] + 1)
+    boop_local = []
+    boop_coarse = []
+    for neighbour in ['voronoi', 'cutoff']:
+        boop_local += ['q%d_%s' % (l, neighbour) for l in l_list] + ['w%d_%s' % (l, neighbour) for l in l_list]
+        boop_coarse += ['Q%d_%s' % (l, neighbour) for l in l_list] + ['W%d_%s' % (l, neighbour) for l in l_list]
+    conventional_SRO = (['coordination_number_voronoi', 'coordination_number_cutoff']
+                        + ['voronoi_idx_%d' % i for i in order] + ['cellfraction']
+                        + ['i_fold_symm_%d' % i for i in order] + ['area_weight_i_fold_symm_%d' % i for i in order]
+                        + ['cpe'] + boop_local)
+    conventional_name, conventional_shell_name = mro_feature_name(conventional_SRO, shell_number)
+    return {'symmetry feature': symmetry_name,
+            'interstice distribution': interstice_name + interstice_shell_name,
+            'conventional feature': conventional_name + boop_coarse + conventional_shell_name}
+
+
+def build_feature_table(feature_array, column_name):
+    # feature_array: 特征名 -> (N, F) 数组，返回特征名 -> 带列名的 DataFrame
+    feature_table = {}
+    for family in FEATURE_FAMILY:
+        if feature_array[family].shape[1] != len(column_name[family]):
+            raise ValueError('%s has %d columns but %d names' % (family, feature_array[family].shape[1],
+                                                                  len(column_name[family])))
+        table = pd.DataFrame(feature_array[family], columns=column_name[family])
+        table.index.name = 'particle'
+        feature_table[family] = table
+    return feature_table
+
+
+def feature_path(path_output, frame, extension, per_run=False):
+    # 每帧一个文件 feature_all-<frame>.<extension>，或整个计算一个 feature_all.<extension>
+    if per_run:
+        return os.path.join(path_output, 'feature_all.' + extension)
+    return os.path.join(path_output, 'feature_all-%d.%s' % (frame, extension))
+
+
+def write_feature_npz(path_output, frame, feature_table, per_run=False):
+    # 每类特征一个数组，列名存为 <特征名>_column
+    if per_run:
+        raise ValueError('npz output writes one file per frame, use parquet or hdf5 for one store per run')
+    array = {}
+    for family, table in feature_table.items():
+        key = family.replace(' ', '_')
+        array[key] = table.to_numpy()
+        array[key + '_column'] = np.array(table.columns, dtype=str)
+    np.savez(feature_path(path_output, frame, 'npz'), frame=frame, **array)
+
+
+def write_feature_parquet(path_output, frame, feature_table, per_run=False):
+    # 三类特征按列拼接为一张表; per_run 时写入 feature_all.parquet 目录，每帧一个分片并带 frame 列，
+    # pd.read_parquet 可以把整个目录读为一张表
+    table = pd.concat(list(feature_table.values()), axis=1)
+    if per_run:
+        directory = feature_path(path_output, frame, 'parquet', per_run=True)
+        os.makedirs(directory, exist_ok=True)
+        table.insert(0, 'frame', frame)
+        table.to_parquet(os.path.join(directory, 'frame-%d.parquet' % frame))
+    else:
+        table.to_parquet(feature_path(path_output, frame, 'parquet'))
+
+
+def write_feature_hdf5(path_output, frame, feature_table, per_run=False):
+    # 每类特征一个 key; per_run 时以 table 格式追加到 feature_all.h5 并带 frame 列 (data column，可按帧查询和删除)
+    with pd.HDFStore(feature_path(path_output, frame, 'h5', per_run), mode='a' if per_run else 'w') as store:
+        for family, table in feature_table.items():
+            key = family.replace(' ', '_')
+            if per_run:
+                store.append(key, pd.concat([pd.DataFrame({'frame': frame}, index=table.index), table], axis=1),
+                             format='table', index=False, data_columns=['frame'])
+            else:
+                store.put(key, table, format='fixed')
+
+
+def write_feature_excel(path_output, frame, feature_table, per_run=False):
+    # 旧的 Excel 输出，每类特征一个 sheet，只在指定时使用
+    if per_run:
+        raise ValueError('excel output writes one workbook per frame')
+    with pd.ExcelWriter(feature_path(path_output, frame, 'xlsx')) as writer:
+        for family, table in feature_table.items():
+            table.to_excel(writer, sheet_name=family)
+
+
+FEATURE_WRITER = {'npz': write_feature_npz, 'parquet': write_feature_parquet, 'hdf5': write_feature_hdf5,
+                  'excel': write_feature_excel}
+FEATURE_EXTENSION = {'npz': 'npz', 'parquet': 'parquet', 'hdf5': 'h5', 'excel': 'xlsx'}
+
+
+def hdf5_frame(path_output):
+    # per_run 的 feature_all.h5 中已有的帧号
+    hdf5_file = feature_path(path_output, 0, 'h5', per_run=True)
+    if not os.path.exists(hdf5_file):
+        return set()
+    with pd.HDFStore(hdf5_file, mode='r') as store:
+        key = FEATURE_FAMILY[0].replace(' ', '_')
+        if key not in store:
+            return set()
+        return set(int(x) for x in np.unique(store.select_column(key, 'frame')))
+
+
+def remove_hdf5_frame(path_output, frame):
+    # 从 per_run 的 feature_all.h5 中删去一帧的所有行
+    with pd.HDFStore(feature_path(path_output, frame, 'h5', per_run=True), mode='a') as store:
+        for family in FEATURE_FAMILY:
+            key = family.replace(' ', '_')
+            if key in store:
+                store.remove(key, where='frame == %d' % frame)
+
+
+def check_output_format(output_format, per_run=False):
+    # 输出格式及其与 per_run 的组合是否可用，在计算任何一帧之前检查
+    if output_format == 'none':
+        return
+    if output_format not in FEATURE_WRITER:
+        raise ValueError('unknown output format %s, choose from %s' % (output_format, ', '.join(FEATURE_WRITER)))
+    if per_run and output_format not in ['parquet', 'hdf5']:
+        raise ValueError('%s output writes one file per frame, use parquet or hdf5 for one store per run'
+                         % output_format)
+
+
+def write_feature(output_format, path_output, frame, feature_table, per_run=False):
+    # output_format 为 none 时不写文件（只写特征库）
+    check_output_format(output_format, per_run)
+    if output_format == 'none':
+        return
+    FEATURE_WRITER[output_format](path_output, frame, feature_table, per_run)
+
+
+# 多帧特征库 path_output/feature store: 帧 × 颗粒 × 特征 的 float64 数组，每算完一帧在文件末尾追加
+#   feature.f8: 数组数据; particle_id.npy: 颗粒 id (各帧相同，升序); feature.json: 列名、各类特征的列范围与已写入的帧号
+# feature.json 在数据写入之后更新，中断时文件末尾多出的数据在下一次追加时截掉
+FeatureStore = namedtuple('FeatureStore', ['feature', 'frame', 'particle_id', 'column', 'group'])
+
+
+def feature_store_path(path_output):
+    return os.path.join(path_output, 'feature store')
+
+
+def feature_store_frame(path_output):
+    # 特征库中已有的帧号
+    meta_file = os.path.join(feature_store_path(path_output), 'feature.json')
+    if not os.path.exists(meta_file):
+        return set()
+    with open(meta_file, 'r') as store_file:
+        return set(json.load(store_file)['frame'])
+
+
+def check_feature_store_column(path_output, column_name):
+    # 在计算任何一帧之前检查已有特征库的列名与本次设置 (-shell, -face, -symmetry) 的列名是否相同
+    meta_file = os.path.join(feature_store_path(path_output), 'feature.json')
+    if not os.path.exists(meta_file):
+        return
+    with open(meta_file, 'r') as store_file:
+        meta = json.load(store_file)
+    if meta['column'] != [name for family in FEATURE_FAMILY for name in column_name[family]]:
+        raise ValueError('the feature columns of this run differ from the feature store in %s'
+                         % feature_store_path(path_output))
+
+
+def append_feature_store(path_output, frame, Par_id, feature_table, replace=False):
+    # 第一帧确定列名与颗粒 id，之后每帧必须相同
+    # replace: 该帧已在特征库中时原位覆盖（重新计算的帧），否则报错
+    store_path = feature_store_path(path_output)
+    os.makedirs(store_path, exist_ok=True)
+    feature = np.ascontiguousarray(np.hstack([feature_table[family].to_numpy() for family in FEATURE_FAMILY]),
+                                   dtype=np.float64)
+    column = [name for family in FEATURE_FAMILY for name in feature_table[family].columns]
+    meta_file = os.path.join(store_path, 'feature.json')
+    id_file = os.path.join(store_path, 'particle_id.npy')
+    if os.path.exists(meta_file):
+        with open(meta_file, 'r') as store_file:
+            meta = json.load(store_file)
+        if meta['column'] != column:
+            raise ValueError('frame %d has different feature columns from the feature store' % frame)
+        if not np.array_equal(np.load(id_file, mmap_mode='r'), Par_id):
+            raise ValueError('frame %d has different particle ids from the feature store' % frame)
+        if int(frame) in meta['frame']:
+            if not replace:
+                raise ValueError('frame %d is already in the feature store' % frame)
+            with open(os.path.join(store_path, 'feature.f8'), 'r+b') as store_file:
+                store_file.seek(meta['frame'].index(int(frame)) * feature.nbytes)
+                store_file.write(feature.tobytes())
+            return
+    else:
+        group = {}
+        start = 0
+        for family in FEATURE_FAMILY:
+            group[family] = [start, start + feature_table[family].shape[1]]
+            start += feature_table[family].shape[1]
+        meta = {'particle_number': len(Par_id), 'column': column, 'group': group, 'frame': []}
+        np.save(id_file, np.asarray(Par_id, dtype=np.int64))
+    frame_size = feature.nbytes
+    with open(os.path.join(store_path, 'feature.f8'), 'ab') as store_file:
+        store_file.truncate(len(meta['frame']) * frame_size)
+        store_file.write(feature.tobytes())
+    meta['frame'].append(int(frame))
+    with open(meta_file + '.tmp', 'w') as store_file:
+        json.dump(meta, store_file)
+    os.replace(meta_file + '.tmp', meta_file)
+
+
+def open_feature_store(path_output, mode='r'):
+    # 以 memmap 打开特征库，feature 为 (帧数, 颗粒数, 特征数)，不读入内存
+    store_path = feature_store_path(path_output)
+    with open(os.path.join(store_path, 'feature.json'), 'r') as store_file:
+        meta = json.load(store_file)
+    shape = (len(meta['frame']), meta['particle_number'], len(meta['column']))
+    if shape[0] == 0:
+        feature = np.zeros(shape)
+    else:
+        feature = np.memmap(os.path.join(store_path, 'feature.f8'), dtype=np.float64, mode=mode, shape=shape)
+    return FeatureStore(feature=feature, frame=np.array(meta['frame'], dtype=np.int64),
+                        particle_id=np.load(os.path.join(store_path, 'particle_id.npy'), mmap_mode='r'),
+                        column=np.array(meta['column'], dtype=str), group=meta['group'])
+
+
+def index_to_slice(index):
+    # 连续的编号转为切片，使 memmap 的索引不产生拷贝
+    if len(index) > 0 and np.all(np.diff(index) == 1):
+        return slice(int(index[0]), int(index[-1]) + 1)
+    return index
+
+
+def select_feature_store(store, frame_range=None, particle_id=None, group=None):
+    # frame_range: (first, last) 帧号闭区间; particle_id: 颗粒 id 集合; group: 特征类名或其列表
+    # 连续的帧、颗粒与单个特征类为 memmap 的视图（不拷贝），不连续的颗粒集合只读取这些颗粒
+    # 返回 (feature, frame, particle_id, column)
+    frame_index = np.arange(len(store.frame))
+    if frame_range is not None:
+        frame_index = np.flatnonzero((store.frame >= frame_range[0]) & (store.frame <= frame_range[1]))
+    particle_index = np.arange(len(store.particle_id))
+    if particle_id is not None:
+        particle_id = np.unique(np.asarray(particle_id, dtype=np.int64))
+        particle_index = np.searchsorted(store.particle_id, particle_id)
+        if np.any(particle_index >= len(store.particle_id)) or \
+                np.any(store.particle_id[np.minimum(particle_index, len(store.particle_id) - 1)] != particle_id):
+            raise KeyError('particle id not in the feature store')
+    column_index = np.arange(len(store.column))
+    if group is not None:
+        group = [group] if isinstance(group, str) else group
+        column_index = np.concatenate([np.arange(*store.group[name]) for name in group])
+    frame_index = index_to_slice(frame_index)
+    particle_index = index_to_slice(particle_index)
+    column_index = index_to_slice(column_index)
+    feature = store.feature[frame_index]
+    feature = feature[:, particle_index]
+    feature = feature[:, :, column_index]
+    return feature, store.frame[frame_index], store.particle_id[particle_index], store.column[column_index]
+
+
+class BackgroundWriter(object):
+    # 后台单线程按提交顺序执行写出任务，与下一帧的计算重叠
+    # 最多 max_pending 个任务未完成，再提交时等待最早的任务完成（背压，限制内存中等待写出的帧数）
+    # 写出任务中的异常在主循环下一次提交或结束时抛出; 一个任务出错后，之后的任务都不再执行
+    def __init__(self, max_pending=2):
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.pending = deque()
+        self.max_pending = max(1, max_pending)
+        self.failed = False
+
+    def run(self, function, args, kwargs):
+        # 在写出线程中按提交顺序执行，之前的任务已出错时跳过（该帧所在的计算已失败）
+        if self.failed:
+            return None
+        try:
+            return function(*args, **kwargs)
+        except BaseException:
+            self.failed = True
+            raise
+
+    def check(self):
+        # 已完成的任务取出结果，有异常时在此抛出
+        while self.pending and self.pending[0].done():
+            self.pending.popleft().result()
+
+    def submit(self, function, *args, **kwargs):
+        self.check()
+        while len(self.pending) >= self.max_pending:
+            self.pending.popleft().result()
+        self.pending.append(self.executor.submit(self.run, function, args, kwargs))
+
+    def close(self):
+        # 某一帧写出出错时，之后的帧不再写出，再抛出该异常
+        try:
+            while self.pending:
+                self.pending.popleft().result()
+        except BaseException:
+            self.cancel()
+            raise
+        self.executor.shutdown(wait=True)
+
+    def cancel(self):
+        # 不再写出尚未开始的帧，等待正在写的帧结束
+        for future in self.pending:
+            future.cancel()
+        self.pending.clear()
+        self.executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            # 主循环已出错: 不掩盖原来的异常
+            self.cancel()
+        return False
+
+
+def write_frame_output(output_format, path_output, frame, Par_id, feature_table, per_run=False, feature_store=False,
+                       replace=False, manifest_entry=None):
+    # 一帧的全部输出，在 BackgroundWriter 的线程中执行
+    # replace: 该帧已在追加式的输出 (per_run hdf5, 特征库) 中，先删去或覆盖旧的结果
+    # manifest_entry: 所有输出写完后追加到 run manifest
+    if replace and output_format == 'hdf5' and per_run:
+        remove_hdf5_frame(path_output, frame)
+    write_feature(output_format, path_output, frame, feature_table, per_run)
+    if feature_store:
+        append_feature_store(path_output, frame, Par_id, feature_table, replace)
+    if manifest_entry is not None:
+        append_run_manifest(path_output, manifest_entry)
+
+
+# 断点续算: path_output/run manifest.jsonl，每写完一帧追加一行
+#   {"frame", "fingerprint": 输入文件名、大小、修改时间 (多帧文件另有时间步偏移), "config": 特征设置的哈希,
+#    "output": 该帧的输出 (相对 path_output)}
+# 再次运行时，记录一致且输出仍在的帧跳过，其余 (中断、输入或设置改变、输出缺失) 的帧重新计算
+RUN_MANIFEST = 'run manifest.jsonl'
+
+
+def input_fingerprint(source_file, offset=None):
+    # 输入文件不存在时为 None（该帧总是重新计算）
+    if not os.path.exists(source_file):
+        return None
+    stat = os.stat(source_file)
+    fingerprint = {'file': os.path.basename(source_file), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    if offset is not None:
+        fingerprint['offset'] = int(offset)
+    return fingerprint
+
+
+def feature_config_hash(symmetry_parameter, shell_number, face_order_range):
+    # 决定特征数值与列的设置; 进程数、输出格式等不影响特征的设置不计入
+    config = {'symmetry_parameter': symmetry_parameter._asdict(), 'shell_number': shell_number,
+              'face_order_range': list(face_order_range)}
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def frame_output(output_format, frame, per_run=False, feature_store=False):
+    # 一帧的输出位置（相对 path_output）
+    check_output_format(output_format, per_run)
+    output = []
+    if output_format == 'parquet' and per_run:
+        output.append('feature_all.parquet/frame-%d.parquet' % frame)
+    elif output_format != 'none':
+        output.append(feature_path('', frame, FEATURE_EXTENSION[output_format], per_run))
+    if feature_store:
+        output.append(feature_store_path(''))
+    return output
+
+
+def load_run_manifest(path_output):
+    # {frame: 最后一次记录}; 末尾不完整的一行（写入时中断）被截掉，之后的记录从新的一行开始
+    manifest_file = os.path.join(path_output, RUN_MANIFEST)
+    manifest = {}
+    if not os.path.exists(manifest_file):
+        return manifest
+    with open(manifest_file, 'rb') as manifest_stream:
+        content = manifest_stream.read()
+    end = content.rfind(b'\n') + 1
+    if end < len(content):
+        with open(manifest_file, 'r+b') as manifest_stream:
+            manifest_stream.truncate(end)
+    for line in content[:end].splitlines():
+        if line.strip():
+            entry = json.loads(line)
+            manifest[entry['frame']] = entry
+    return manifest
+
+
+def append_run_manifest(path_output, entry):
+    with open(os.path.join(path_output, RUN_MANIFEST), 'a') as manifest_stream:
+        manifest_stream.write(json.dumps(entry, sort_keys=True) + '\n')
+        manifest_stream.flush()
+        os.fsync(manifest_stream.fileno())
+
+
+def frame_complete(path_output, entry, manifest_entry, written_frame):
+    # 记录与本次的输入、设置、输出位置一致，且输出仍在
+    # written_frame: 追加式输出 (per_run hdf5, 特征库) 中已有的帧号
+    if entry is None or entry['fingerprint'] is None or entry != manifest_entry:
+        return False
+    for output in entry['output']:
+        if output in written_frame:
+            if entry['frame'] not in written_frame[output]:
+                return False
+        elif not os.path.exists(os.path.join(path_output, output)):
+            return False
+    return True
+
+
+# 三类特征共用的一帧输入: 坐标、半径、voronoi 划分与邻域、截断距离邻域、邻居凸包、外层邻域
+FrameInput = namedtuple('FrameInput', ['points', 'radius', 'tessellation', 'voronoi_bonds', 'neighbour_list',
+                                       'hull_feature', 'shell_csr'])
+# 共享内存中的一个数组: 由 name 映射，shape 与 dtype 还原
+SharedArray = namedtuple('SharedArray', ['name', 'shape', 'dtype'])
+
+
+class SharedArrayBlock(object):
+    # 把一帧的只读输入数组复制到 multiprocessing.shared_memory，退出时 close 并 unlink
+    # share 保留 namedtuple / list 的结构，其中的数组替换为 SharedArray，其余值原样传递
+    def __init__(self):
+        self.memory = []
+
+    def share(self, value):
+        if isinstance(value, np.ndarray):
+            memory = shared_memory.SharedMemory(create=True, size=max(1, value.nbytes))
+            self.memory.append(memory)
+            np.ndarray(value.shape, dtype=value.dtype, buffer=memory.buf)[...] = value
+            return SharedArray(memory.name, value.shape, value.dtype)
+        if isinstance(value, tuple) and hasattr(value, '_fields'):
+            return type(value)(*[self.share(x) for x in value])
+        if isinstance(value, list):
+            return [self.share(x) for x in value]
+        return value
+
+    def close(self):
+        for memory in self.memory:
+            memory.close()
+            memory.unlink()
+        self.memory = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+def attach_shared_array(value, memory):
+    # SharedArrayBlock.share 的逆过程，在 worker 中映射共享内存，打开的 SharedMemory 加入 memory 以便之后 close
+    if isinstance(value, SharedArray):
+        block = shared_memory.SharedMemory(name=value.name)
+        memory.append(block)
+        return np.ndarray(value.shape, dtype=value.dtype, buffer=block.buf)
+    if isinstance(value, tuple) and hasattr(value, '_fields'):
+        return type(value)(*[attach_shared_array(x, memory) for x in value])
+    if isinstance(value, list):
+        return [attach_shared_array(x, memory) for x in value]
+    return value
+
+
+def compute_feature_family(family, frame_input, setting):
+    # 由一帧的输入计算一类特征
+    if family == 'symmetry feature':
+        return compute_symmetry_functions(points=frame_input.points, radius=frame_input.radius,
+                                          neighbour_list=frame_input.neighbour_list,
+                                          parameter=setting.symmetry_parameter)
+    if family == 'interstice distribution':
+        return compute_interstice_distribution(neighbour=None, points=frame_input.points, radius=frame_input.radius,
+                                               hull_feature=frame_input.hull_feature, shell_csr=frame_input.shell_csr,
+                                               voronoi_bonds=frame_input.voronoi_bonds)
+    return compute_conventional_feature(points=frame_input.points, tessellation=frame_input.tessellation,
+                                        neighbour=None, radius=frame_input.radius,
+                                        neighbour_list=frame_input.neighbour_list,
+                                        hull_feature=frame_input.hull_feature, shell_csr=frame_input.shell_csr,
+                                        face_order_range=setting.face_order_range,
+                                        voronoi_bonds=frame_input.voronoi_bonds)
+
+
+def compute_shared_feature_family(family, shared_input, setting):
+    # worker 中执行: 映射共享内存中的输入，计算一类特征，结果为新数组，返回时复制回主进程
+    memory = []
+    frame_input = attach_shared_array(shared_input, memory)
+    try:
+        return compute_feature_family(family, frame_input, setting)
+    finally:
+        del frame_input
+        for block in memory:
+            try:
+                block.close()
+            except BufferError:
+                # 异常的 traceback 仍引用映射的数组，留给垃圾回收
+                pass
+
+
+# 一帧特征计算的设置，随每一帧发送到进程池中
+FrameSetting = namedtuple('FrameSetting', ['voronoi_workers', 'symmetry_parameter', 'shell_number',
+                                           'face_order_range'])
+
+
+def compute_frame_feature(Par_coord, Par_radius, boundary, setting, family_executor=None, voronoi_pool=None):
+    # 一帧的三类特征，返回 {特征类别: (N, F) 数组}; 为顶层函数，可在进程池的 worker 中执行
+    # family_executor: 给出时三类特征在该进程池中同时计算 (大的单帧)
+    # voronoi_pool: setting.voronoi_workers > 1 时各帧共用的 voronoi_executor
+    # step1. Gets the prepared coordinates information and neighborhood information
+    tessellation, voronoi_neighbour = compute_voronoi_neighbour(Par_coord, Par_radius, boundary,
+                                                                workers=setting.voronoi_workers,
+                                                                executor=voronoi_pool)
+    # step2. Compute structure property(symmetry feature, interstice distribution and conventional feature)
+    # 所有截断距离邻域共用一次 KDTree 查询（对称函数截断距离与 3r 中较大者）
+    neighbour_list = build_neighbour_list(Par_coord, max(setting.symmetry_parameter.cutoff, 3.0) * Par_radius[0])
+    voronoi_bonds = voronoi_bond(voronoi_neighbour)
+    voronoi_csr = build_bond_csr(voronoi_bonds, len(Par_coord), points=Par_coord)
+    # interstice area, interstice volume 与 cpe 共用每个颗粒的一次邻居凸包
+    hull_feature = compute_neighbour_hull_feature(voronoi_csr, Par_coord, Par_radius)
+    shell_csr = None
+    if setting.shell_number > 1:
+        shell_csr = build_shell_csr(voronoi_csr.offset, voronoi_csr.index, setting.shell_number)
+    frame_input = FrameInput(points=Par_coord, radius=Par_radius, tessellation=tessellation,
+                             voronoi_bonds=voronoi_bonds, neighbour_list=neighbour_list, hull_feature=hull_feature,
+                             shell_csr=shell_csr)
+    if family_executor is None:
+        return {family: compute_feature_family(family, frame_input, setting) for family in FEATURE_FAMILY}
+    # 三类特征各在一个 worker 中同时计算，输入数组放在共享内存中，worker 直接映射而不复制
+    with SharedArrayBlock() as shared:
+        shared_input = shared.share(frame_input)
+        future = {family: family_executor.submit(compute_shared_feature_family, family, shared_input, setting)
+                  for family in FEATURE_FAMILY}
+        return {family: future[family].result() for family in FEATURE_FAMILY}
+
+
+def initialize_frame_worker(thread_number, symmetry_parameter):
+    # 进程池 worker 启动时执行一次:
+    # numba 线程数按 worker 数均分，避免多个进程各开满全部线程
+    # 顶层 numba 核为 cache=True，从磁盘缓存加载; 对称函数核为闭包不能缓存，在此编译一次，之后各帧复用
+    numba.set_num_threads(max(1, min(thread_number, numba.config.NUMBA_NUM_THREADS)))
+    make_symmetry_kernel(symmetry_parameter)(np.zeros(2, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0),
+                                             np.zeros((1, 3)), 1.0)
+
+
+def compute_frames(frames, setting, jobs=1, frames_in_flight=None, family_parallel=False):
+    # 依帧号顺序产生 (frame, Par_id, feature_array)
+    # jobs > 1 时各帧发送到 jobs 个进程的进程池，最多 frames_in_flight 帧（默认 2 * jobs，至少 jobs + 1）已读入而未取回，
+    # 其中包括 prefetch_frame 在后台预读的一帧，限制内存
+    # 结果按提交顺序取回，与 jobs = 1 时的输出顺序相同
+    # family_parallel: jobs = 1 时每帧的三类特征在一个常驻的三进程池中同时计算
+    # jobs = 1 且 setting.voronoi_workers > 1 时 voronoi 子区域划分的进程池也只建一次，各帧复用
+    if jobs <= 1:
+        family_executor = None
+        voronoi_pool = None
+        if setting.voronoi_workers > 1:
+            voronoi_pool = voronoi_executor(setting.voronoi_workers)
+        if family_parallel:
+            thread_number = max(1, numba.config.NUMBA_NUM_THREADS // len(FEATURE_FAMILY))
+            family_executor = ProcessPoolExecutor(max_workers=len(FEATURE_FAMILY),
+                                                  mp_context=multiprocessing.get_context('spawn'),
+                                                  initializer=initialize_frame_worker,
+                                                  initargs=(thread_number, setting.symmetry_parameter))
+        try:
+            for frame, Par_id, Par_coord, Par_radius, boundary in prefetch_frame(frames):
+                yield frame, Par_id, compute_frame_feature(Par_coord, Par_radius, boundary, setting, family_executor,
+                                                           voronoi_pool)
+        finally:
+            if family_executor is not None:
+                family_executor.shutdown(wait=True)
+            if voronoi_pool is not None:
+                voronoi_pool.shutdown(wait=True)
+        return
+    if family_parallel:
+        print('-jobs %d: the feature families of each frame run one after another in its worker' % jobs)
+    if frames_in_flight is None:
+        frames_in_flight = 2 * jobs
+    frames_in_flight = max(jobs + 1, frames_in_flight)
+    if setting.voronoi_workers > 1:
+        # worker 进程中不再开 voronoi 子进程，帧间并行已占满进程数
+        print('-jobs %d: voronoi tessellation of each frame runs serially in its worker' % jobs)
+        setting = setting._replace(voronoi_workers=1)
+    thread_number = max(1, numba.config.NUMBA_NUM_THREADS // jobs)
+    # spawn: 主进程已有 numba 线程池和读取、写出线程，fork 出的 worker 可能死锁
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=initialize_frame_worker,
+                             initargs=(thread_number, setting.symmetry_parameter)) as executor:
+        pending = deque()
+        try:
+            for frame, Par_id, Par_coord, Par_radius, boundary in prefetch_frame(frames):
+                # 取到这一帧时后台已在预读下一帧: 已提交的帧、这一帧与预读的一帧合计不超过 frames_in_flight
+                # memmap 的缓存帧复制为普通数组再发送
+                pending.append((frame, Par_id, executor.submit(compute_frame_feature, np.array(Par_coord),
+                                                               np.array(Par_radius), boundary, setting)))
+                while len(pending) > frames_in_flight - 2:
+                    frame_done, Par_id_done, future = pending.popleft()
+                    yield frame_done, Par_id_done, future.result()
+            while pending:
+                frame_done, Par_id_done, future = pending.popleft()
+                yield frame_done, Par_id_done, future.result()
+        finally:
+            # 出错或提前结束时不再计算尚未开始的帧
+            for frame_done, Par_id_done, future in pending:
+                future.cancel()
+
+
+def main_function(path, path_output, scenario, frame_cache=False, voronoi_workers=1, symmetry_parameter=None,
+                  shell_number=1, face_order_range=(3, 7), output_format='npz',
+                  per_run=False, feature_store=False, write_queue=2, jobs=1, frames_in_flight=None,
+                  family_parallel=False, resume=True):
+    # path 为目录时读取其中的 dump-<frame>.sample，为文件时按多帧 dump 文件流式读取
+    # symmetry_parameter: 对称函数参数集，None 为默认参数
+    # shell_number: MRO 统计的 Voronoi 邻域层数，大于 1 时在 interstice distribution 和 conventional feature 后追加列
+    # face_order_range: voronoi index 与 i-fold symm 统计的面阶数范围
+    # output_format: npz, parquet, hdf5, excel 或 none; per_run 为 True 时所有帧写入同一个文件 (parquet, hdf5)
+    # feature_store: 为 True 时每帧同时追加到 path_output/feature store（memmap 特征库）
+    # write_queue: 后台写出线程中最多等待的帧数，写出与下一帧的计算重叠
+    # jobs: 帧间并行的进程数; frames_in_flight: 已读入而未取回的最大帧数（含后台预读的一帧），默认 2 * jobs
+    # family_parallel: 每帧的三类特征在三个进程中同时计算，输入放在共享内存中 (jobs = 1 时有效)
+    # resume: 跳过 path_output/run manifest.jsonl 中已完成且输入、设置未变的帧; False 时全部重新计算
+    if symmetry_parameter is None:
+        symmetry_parameter = DEFAULT_SYMMETRY_PARAMETER
+    check_output_format(output_format, per_run)
+    column_name = feature_column_name(symmetry_parameter, shell_number, face_order_range)
+    # dump files
+    mkdir(path_output)
+    if os.path.isfile(path):
+        dump_index = index_dump_timestep(path)
+        dump_frame = sorted(dump_index)
+    else:
+        dump_frame = list_dump_frame(path)
+    frame_list = select_frame(dump_frame, scenario)
+    # 首帧不计算
+    # 每帧的 run manifest 记录，已完成且未改变的帧跳过
+    config = feature_config_hash(symmetry_parameter, shell_number, face_order_range)
+    manifest = load_run_manifest(path_output) if resume else {}
+    written_frame = {}
+    if output_format == 'hdf5' and per_run:
+        written_frame[feature_path('', 0, 'h5', per_run=True)] = hdf5_frame(path_output)
+    if feature_store:
+        check_feature_store_column(path_output, column_name)
+        written_frame[feature_store_path('')] = feature_store_frame(path_output)
+    manifest_entry = {}
+    # scenario 大于帧号跨度时 select_frame 取整后有重复的帧号，每帧只计算一次
+    frame_list = sorted(set(int(frame) for frame in frame_list[1:]))
+    for frame in frame_list:
+        if not os.path.isfile(path):
+            fingerprint = input_fingerprint(dump_source_file(path, frame))
+        elif frame in dump_index:
+            fingerprint = input_fingerprint(path, dump_index[frame])
+        else:
+            fingerprint = None
+        manifest_entry[frame] = {'frame': frame, 'fingerprint': fingerprint, 'config': config,
+                                 'output': frame_output(output_format, frame, per_run, feature_store)}
+    frame_todo = [frame for frame in frame_list
+                  if not frame_complete(path_output, manifest.get(frame), manifest_entry[frame], written_frame)]
+    if len(frame_todo) < len(frame_list):
+        print('%d of %d frames are complete in %s, skipped' % (len(frame_list) - len(frame_todo), len(frame_list),
+                                                              RUN_MANIFEST))
+    if os.path.isfile(path):
+        frames = iter_dump_timestep(path, frame_todo, dump_index, frame_cache)
+    else:
+        frames = iter_dump_directory(path, frame_todo, frame_cache)
     # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
     # 循环开始，提取每一步数据
     #
-    for idx, frame in enumerate(frame_list):
-        if idx == 0: continue
-        # step1. Gets the prepared coordinates information and neighborhood information
-        Par_coord, Par_radius, boundary = read_position_information(path, frame)
-        voronoi, voronoi_neighbour, area_all = compute_voronoi_neighbour(Par_coord, Par_radius, boundary)
-        print(60 * '*')
-        print('The %d th frame' % frame)
-        print(60 * '*')
-        # step2. Compute structure property(symmetry feature, interstice distribution and conventional feature)
-        symmetry_feature = compute_symmetry_functions(points=Par_coord, radius=Par_radius)
-        interstice_distribution = compute_interstice_distribution(neighbour=voronoi_neighbour, points=Par_coord,
-                                                                  radius=Par_radius)
-        conventional_feature = compute_conventional_feature(points=Par_coord, area_all=area_all,
-                                                            neighbour=voronoi_neighbour, voronoi=voronoi,
-                                                            radius=Par_radius)
-        # step3. Output structure property
-        writer = pd.ExcelWriter(path_output + '/feature_all-' + str(frame) + '.xlsx')
-        pd.DataFrame(symmetry_feature).to_excel(writer, sheet_name='symmetry feature')
-        pd.DataFrame(interstice_distribution).to_excel(writer, sheet_name='interstice distribution')
-        pd.DataFrame(conventional_feature).to_excel(writer, sheet_name='conventional feature')
-        writer.save()
-        writer.close()
+    setting = FrameSetting(voronoi_workers, symmetry_parameter, shell_number, face_order_range)
+    with BackgroundWriter(write_queue) as writer:
+        for frame, Par_id, feature_array in compute_frames(frames, setting, jobs, frames_in_flight,
+                                                           family_parallel):
+            print(60 * '*')
+            print('The %d th frame' % frame)
+            print(60 * '*')
+            # step3. Output structure property
+            feature_table = build_feature_table(feature_array, column_name)
+            # 已在追加式输出中的帧（上次中断或已过期）覆盖旧的结果
+            # written_frame 始终包含追加式输出中已有或已提交写出的所有帧，提交后即加入，同一帧不会追加两次
+            replace = any(frame in written for written in written_frame.values())
+            writer.submit(write_frame_output, output_format, path_output, frame, Par_id, feature_table, per_run,
+                          feature_store, replace, manifest_entry[frame])
+            for written in written_frame.values():
+                written.add(frame)
+
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# benchmark
+def benchmark_read_position_information(dump_path, frame, repeat=3):
+    # 对比向量化读取与旧的正则读取 (structure_property_reference)，检查结果一致并输出耗时
+    from structure_property_reference import read_position_information_regex
+    time_regex = []
+    time_vector = []
+    for x in range(repeat):
+        t0 = time.perf_counter()
+        coord_regex, radius_regex, boundary_regex = read_position_information_regex(dump_path, frame)
+        time_regex.append(time.perf_counter() - t0)
+        t0 = time.perf_counter()
+        coord_vector, radius_vector, boundary_vector = read_position_information(dump_path, frame)
+        time_vector.append(time.perf_counter() - t0)
+    same = (np.array_equal(coord_regex, coord_vector) and np.array_equal(radius_regex, radius_vector)
+            and boundary_regex == boundary_vector)
+    print('read_position_information benchmark, frame %d, %d particles' % (frame, len(coord_vector)))
+    print('    regex parser     : %.4f s' % min(time_regex))
+    print('    vectorized parser: %.4f s' % min(time_vector))
+    print('    speedup          : %.1f x' % (min(time_regex) / min(time_vector)))
+    print('    identical output : %s' % same)
+    return min(time_regex), min(time_vector), same
+
+
+def benchmark_voronoi(Par_coord, Par_radius, boundary, workers_list=(1, 2, 4, 8, 16)):
+    # 子区域并行 voronoi 划分随进程数的加速比，并与串行结果逐个 cell 对比
+    # 拓扑（每个 cell 的相邻 cell 及面的边数）必须完全一致，体积和面积只允许舍入误差
+    workers_list = [workers for workers in workers_list if workers <= (os.cpu_count() or 1)] or [1]
+    # 预热 numba 编译，并运行一次 parallel 核（邻居凸包），使主进程与实际计算时一样已有 numba 线程池
+    tessellation, neighbour = compute_voronoi_neighbour(Par_coord[:64], Par_radius, boundary)
+    compute_neighbour_hull_feature(build_bond_csr(voronoi_bond(neighbour), 64, points=Par_coord[:64]), Par_coord[:64],
+                                   Par_radius[:64])
+    t0 = time.perf_counter()
+    serial, serial_neighbour = compute_voronoi_neighbour(Par_coord, Par_radius, boundary)
+    time_serial = time.perf_counter() - t0
+    print('voronoi benchmark, %d particles' % len(Par_coord))
+    print('    serial             : %.3f s' % time_serial)
+    serial_face = [sorted(zip(serial.face_adjacent_cell[serial.cell_face_offset[x]:serial.cell_face_offset[x + 1]],
+                              serial.face_vertex_number[serial.cell_face_offset[x]:serial.cell_face_offset[x + 1]]))
+                   for x in range(len(Par_coord))]
+    row = np.repeat(np.arange(len(Par_coord)), np.diff(serial_neighbour.offset))
+    result = []
+    for workers in workers_list:
+        # 进程池在计时之外建立并预热，与多帧计算时各帧复用同一进程池的情形相同
+        executor = voronoi_executor(workers)
+        compute_voronoi_neighbour(Par_coord, Par_radius, boundary, workers=workers, executor=executor)
+        t0 = time.perf_counter()
+        parallel, parallel_neighbour = compute_voronoi_neighbour(Par_coord, Par_radius, boundary, workers=workers,
+                                                                 executor=executor)
+        time_parallel = time.perf_counter() - t0
+        executor.shutdown(wait=True)
+        offset = parallel.cell_face_offset
+        same_topology = all(
+            sorted(zip(parallel.face_adjacent_cell[offset[x]:offset[x + 1]],
+                       parallel.face_vertex_number[offset[x]:offset[x + 1]])) == serial_face[x]
+            for x in range(len(Par_coord)))
+        # 每个 cell 内的邻居按编号排序后比较
+        same_neighbour = (np.array_equal(parallel_neighbour.offset, serial_neighbour.offset)
+                          and np.array_equal(parallel_neighbour.index[np.lexsort((parallel_neighbour.index, row))],
+                                             serial_neighbour.index[np.lexsort((serial_neighbour.index, row))]))
+        volume_error = np.max(np.abs(parallel.volume - serial.volume))
+        area_error = abs(np.sum(parallel.face_area) - np.sum(serial.face_area))
+        print('    %2d workers         : %.3f s, speedup %.2f x, same topology %s, same neighbour %s, '
+              'max volume error %.2e, total area error %.2e'
+              % (workers, time_parallel, time_serial / time_parallel, same_topology, same_neighbour,
+                 volume_error, area_error))
+        result.append([workers, time_parallel])
+    return time_serial, result
+
+
+def benchmark_angular(Par_coord, Par_radius, thread_list=(1, 4, 16)):
+    # 新的角向对称函数核与旧的 compute_angular_element (structure_property_reference) 的耗时和差异，
+    # 线程数超过 numba 可用线程数时跳过
+    from structure_property_reference import compute_angular_element
+    a_list = np.array([14.638, 14.638, 14.638, 14.638, 2.554, 2.554, 2.554, 2.554, 1.648, 1.648, 1.204, 1.204,
+                       1.204, 1.204, 0.933, 0.933, 0.933, 0.933, 0.695, 0.695, 0.695, 0.695])
+    b_list = np.array([-1, 1, -1, 1, -1, 1, -1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1])
+    c_list = np.array([1, 1, 2, 2, 1, 1, 2, 2, 1, 2, 1, 2, 4, 16, 1, 2, 4, 16, 1, 2, 4, 16])
+    points = np.ascontiguousarray(Par_coord, dtype=np.float64)
+    neighbour_list = build_neighbour_list(points, 5.0 * Par_radius[0])
+    bond_csr = build_bond_csr(neighbour_list.pairs, len(points), neighbour_list.distance)
+    width, width_id, b_unique, c_unique, term_id = group_angular_parameter(a_list, b_list, c_list)
+    like = np.empty(shape=[22, len(points)])
+    # 预热 numba 编译
+    compute_angular_element(bond_csr.offset[:2], bond_csr.index, bond_csr.distance, points, a_list, b_list, c_list,
+                            Par_radius[0], like[:, :1])
+    compute_angular_value(bond_csr.offset[:2], bond_csr.index, points, width, width_id, b_unique, c_unique, term_id,
+                          Par_radius[0])
+    t0 = time.perf_counter()
+    reference = compute_angular_element(bond_csr.offset, bond_csr.index, bond_csr.distance, points, a_list, b_list,
+                                        c_list, Par_radius[0], like).T
+    time_reference = time.perf_counter() - t0
+    print('angular symmetry function benchmark, %d particles, %d bonds' % (len(points), len(neighbour_list.pairs)))
+    print('    compute_angular_element        : %.3f s' % time_reference)
+    thread_default = numba.get_num_threads()
+    result = []
+    for threads in thread_list:
+        if threads > numba.config.NUMBA_NUM_THREADS:
+            print('    compute_angular_value, %2d threads: skipped, only %d available'
+                  % (threads, numba.config.NUMBA_NUM_THREADS))
+            continue
+        numba.set_num_threads(threads)
+        t0 = time.perf_counter()
+        angular_value = compute_angular_value(bond_csr.offset, bond_csr.index, points, width, width_id, b_unique,
+                                              c_unique, term_id, Par_radius[0])
+        time_now = time.perf_counter() - t0
+        deviation = np.max(np.abs(angular_value - reference) / np.maximum(np.abs(reference), 1e-300))
+        print('    compute_angular_value, %2d threads: %.3f s, speedup %.1f x, max relative deviation %.2e'
+              % (threads, time_now, time_reference / time_now, deviation))
+        result.append([threads, time_now, deviation])
+    numba.set_num_threads(thread_default)
+    return time_reference, result
+
+
+def benchmark_radial(Par_coord, Par_radius, window_list=(3.0, 4.0, 6.0, 8.0)):
+    # 截断径向对称函数相对精确计算的耗时与偏差
+    points = np.ascontiguousarray(Par_coord, dtype=np.float64)
+    neighbour_list = build_neighbour_list(points, 5.0 * Par_radius[0])
+    bond_csr = build_bond_csr(neighbour_list.pairs, len(points), neighbour_list.distance)
+    centre = np.linspace(0.1, 5.0, 50) * Par_radius[0]
+    sigma = 0.1 * Par_radius[0]
+    # 预热 numba 编译
+    compute_radial_value(bond_csr.offset[:2], bond_csr.distance, centre, sigma, np.inf)
+    t0 = time.perf_counter()
+    exact = compute_radial_value(bond_csr.offset, bond_csr.distance, centre, sigma, np.inf)
+    time_exact = time.perf_counter() - t0
+    print('radial symmetry function benchmark, %d particles, %d bonds' % (len(points), len(neighbour_list.pairs)))
+    print('    exact          : %.3f s' % time_exact)
+    result = []
+    for window in window_list:
+        t0 = time.perf_counter()
+        truncated = compute_radial_value(bond_csr.offset, bond_csr.distance, centre, sigma, window)
+        time_now = time.perf_counter() - t0
+        deviation = np.abs(truncated - exact)
+        print('    window %4.1f sigma: %.3f s, speedup %.1f x, max abs deviation %.2e, '
+              'relative to the largest value %.2e'
+              % (window, time_now, time_exact / time_now, np.max(deviation), np.max(deviation) / np.max(exact)))
+        result.append([window, time_now, np.max(deviation)])
+    return time_exact, result
+
+
+def benchmark_neighbour_hull(Par_coord, Par_radius, boundary):
+    # 共用邻居凸包的一次遍历与旧的三次 ConvexHull 计算 (structure_property_reference) 的耗时和差异
+    from structure_property_reference import (compute_interstice_area_monosize, compute_interstice_volume,
+                                              compute_cluster_packing_efficiency)
+    tessellation, voronoi_neighbour = compute_voronoi_neighbour(Par_coord, Par_radius, boundary)
+    voronoi_csr = build_bond_csr(voronoi_bond(voronoi_neighbour), len(Par_coord), points=Par_coord)
+    voronoi_neighbour_use = csr_to_list(voronoi_csr)
+    # 预热 numba 编译
+    compute_neighbour_hull_feature(voronoi_csr, Par_coord, Par_radius)
+    t0 = time.perf_counter()
+    interstice_area = compute_interstice_area_monosize(voronoi_neighbour_use, Par_coord, Par_radius[0])
+    interstice_volume = compute_interstice_volume(voronoi_neighbour_use, Par_coord, Par_radius)
+    cluster_packing_efficiency = compute_cluster_packing_efficiency(voronoi_neighbour_use, Par_coord, Par_radius)
+    time_reference = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    hull_feature = compute_neighbour_hull_feature(voronoi_csr, Par_coord, Par_radius)
+    time_now = time.perf_counter() - t0
+    print('neighbour hull benchmark, %d particles' % len(Par_coord))
+    print('    three ConvexHull passes : %.3f s' % time_reference)
+    print('    shared neighbour hull   : %.3f s, speedup %.1f x' % (time_now, time_reference / time_now))
+    for name, reference, value in [['interstice area', interstice_area, hull_feature.interstice_area],
+                                   ['interstice volume', interstice_volume, hull_feature.interstice_volume],
+                                   ['cluster packing efficiency', cluster_packing_efficiency,
+                                    hull_feature.cluster_packing_efficiency]]:
+        print('    %-26s max abs deviation %.2e' % (name, np.max(np.abs(value - reference))))
+    return time_reference, time_now
+
+
+def benchmark_boop(Par_coord, Par_radius, boundary):
+    # 批量 BOO 与逐个 l 调用 pyboo (structure_property_reference) 的耗时和差异
+    from structure_property_reference import compute_boop_pyboo
+    tessellation, voronoi_neighbour = compute_voronoi_neighbour(Par_coord, Par_radius, boundary)
+    bonds = voronoi_bond(voronoi_neighbour)
+    neighbour_list = build_neighbour_list(Par_coord, 3.0 * Par_radius[0])
+    # 预热 numba 编译
+    compute_boop(np.array([[0, 1]]), Par_coord[:2], Par_radius)
+    t0 = time.perf_counter()
+    reference = compute_boop_pyboo(bonds, slice_neighbour_list(neighbour_list, 3.0 * Par_radius[0])[0], Par_coord)
+    time_reference = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    boop_all = compute_boop(bonds, Par_coord, Par_radius, neighbour_list)
+    time_now = time.perf_counter() - t0
+    deviation = np.abs(boop_all - reference)
+    print('bond orientational order benchmark, %d particles' % len(Par_coord))
+    print('    pyboo, one l at a time : %.3f s' % time_reference)
+    print('    batched                : %.3f s, speedup %.1f x' % (time_now, time_reference / time_now))
+    print('    max abs deviation %.2e, relative to the largest value of each column %.2e'
+          % (np.max(deviation), np.max(deviation / np.maximum(np.max(np.abs(reference), axis=0), 1e-300))))
+    return time_reference, time_now
+
+
+def benchmark_frame_throughput(path, jobs_list=(1, 2, 4, 8), frame_number=8):
+    # 帧间并行的吞吐量 (frames/min) 随进程数的变化，并检查各进程数的特征与串行结果一致
+    # 进程数超过 CPU 数时跳过; 帧数少于 frame_number 时重复使用已有的帧
+    jobs_list = [jobs for jobs in jobs_list if jobs <= (os.cpu_count() or 1)] or [1]
+    if os.path.isfile(path):
+        dump_index = index_dump_timestep(path)
+        frame_list = sorted(dump_index)[:frame_number]
+        frame_data = list(iter_dump_timestep(path, frame_list, dump_index))
+    else:
+        frame_list = list_dump_frame(path)[:frame_number]
+        frame_data = list(iter_dump_directory(path, frame_list))
+    frame_data = [frame_data[x % len(frame_data)] for x in range(frame_number)]
+    setting = FrameSetting(1, DEFAULT_SYMMETRY_PARAMETER, 1, (3, 7))
+    # 预热 numba 编译（同时写入磁盘缓存，worker 进程直接加载）
+    frame, Par_id, Par_coord, Par_radius, boundary = frame_data[0]
+    compute_frame_feature(Par_coord, Par_radius, boundary, setting)
+    print('frame throughput benchmark, %d frames, %d particles per frame' % (frame_number, len(Par_coord)))
+    reference = None
+    result = []
+    for jobs in jobs_list:
+        t0 = time.perf_counter()
+        feature = [feature_array for frame, Par_id, feature_array in compute_frames(frame_data, setting, jobs)]
+        time_jobs = time.perf_counter() - t0
+        if reference is None:
+            reference = feature
+        same = all(np.array_equal(feature[x][family], reference[x][family])
+                   for x in range(frame_number) for family in FEATURE_FAMILY)
+        print('    %2d jobs : %.3f s, %.1f frames/min, identical features %s'
+              % (jobs, time_jobs, 60.0 * frame_number / time_jobs, same))
+        result.append([jobs, 60.0 * frame_number / time_jobs])
+    return result
+
+
+def benchmark_family_parallel(Par_coord, Par_radius, boundary, repeat=3):
+    # 单帧延迟: 三类特征依次计算与在三个进程中同时计算（共享内存输入）的对比，并检查结果一致
+    setting = FrameSetting(1, DEFAULT_SYMMETRY_PARAMETER, 1, (3, 7))
+    # 预热 numba 编译（同时写入磁盘缓存，worker 进程直接加载）
+    reference = compute_frame_feature(Par_coord, Par_radius, boundary, setting)
+    time_serial = []
+    for x in range(repeat):
+        t0 = time.perf_counter()
+        compute_frame_feature(Par_coord, Par_radius, boundary, setting)
+        time_serial.append(time.perf_counter() - t0)
+    thread_number = max(1, numba.config.NUMBA_NUM_THREADS // len(FEATURE_FAMILY))
+    with ProcessPoolExecutor(max_workers=len(FEATURE_FAMILY), mp_context=multiprocessing.get_context('spawn'),
+                             initializer=initialize_frame_worker,
+                             initargs=(thread_number, setting.symmetry_parameter)) as executor:
+        # 第一帧启动 worker 进程，不计时
+        feature = compute_frame_feature(Par_coord, Par_radius, boundary, setting, executor)
+        time_parallel = []
+        for x in range(repeat):
+            t0 = time.perf_counter()
+            compute_frame_feature(Par_coord, Par_radius, boundary, setting, executor)
+            time_parallel.append(time.perf_counter() - t0)
+    same = all(np.array_equal(feature[family], reference[family]) for family in FEATURE_FAMILY)
+    print('feature family benchmark, %d particles' % len(Par_coord))
+    print('    one after another : %.3f s' % min(time_serial))
+    print('    3 workers         : %.3f s, speedup %.2f x'
+          % (min(time_parallel), min(time_serial) / min(time_parallel)))
+    print('    identical features: %s' % same)
+    return min(time_serial), min(time_parallel), same
+
+
+def read_first_frame(path):
+    # benchmark 使用的帧: 目录中的第一个 dump 文件或多帧 dump 文件的第一个时间步
+    if os.path.isfile(path):
+        dump_index = index_dump_timestep(path)
+        frame, Par_id, Par_coord, Par_radius, boundary = next(iter_dump_timestep(path, [min(dump_index)], dump_index))
+        return frame, Par_coord, Par_radius, boundary
+    frame = list_dump_frame(path)[0]
+    Par_coord, Par_radius, boundary = load_position_information(path, frame)
+    return frame, Par_coord, Par_radius, boundary
+
+
+def run_benchmark(name, path, path_output, scenario):
+    if name == 'read':
+        benchmark_read_position_information(path, list_dump_frame(path)[0])
+    elif name == 'angular':
+        frame, Par_coord, Par_radius, boundary = read_first_frame(path)
+        benchmark_angular(Par_coord, Par_radius)
+    elif name == 'radial':
+        frame, Par_coord, Par_radius, boundary = read_first_frame(path)
+        benchmark_radial(Par_coord, Par_radius)
+    elif name == 'voronoi':
+        frame, Par_coord, Par_radius, boundary = read_first_frame(path)
+        benchmark_voronoi(Par_coord, Par_radius, boundary)
+    elif name == 'hull':
+        frame, Par_coord, Par_radius, boundary = read_first_frame(path)
+        benchmark_neighbour_hull(Par_coord, Par_radius, boundary)
+    elif name == 'boop':
+        frame, Par_coord, Par_radius, boundary = read_first_frame(path)
+        benchmark_boop(Par_coord, Par_radius, boundary)
+    elif name == 'jobs':
+        benchmark_frame_throughput(path)
+    elif name == 'family':
+        frame, Par_coord, Par_radius, boundary = read_first_frame(path)
+        benchmark_family_parallel(Par_coord, Par_radius, boundary)
+    else:
+        print('unknown benchmark: %s' % name)
 
 
 # ==================================================================
@@ -1116,11 +2427,26 @@ if __name__ == '__main__':
     path_ = 'D:/循环剪切试验和机器学习/cyc5300fric01shearrate025/sort position'
     path_output_ = 'D:/循环剪切试验和机器学习/cyc5300fric01shearrate025'
     scenario = 1000
+    benchmark = None
+    frame_cache = False
+    voronoi_workers = 1
+    symmetry_parameter = None
+    shell_number = 1
+    face_order_range = (3, 7)
+    output_format = 'npz'
+    per_run = False
+    feature_store = False
+    jobs = 1
+    frames_in_flight = None
+    family_parallel = False
+    resume = True
     argList = argv
     argc = len(argList)
     i = 0
     while (i < argc):
-        if (argList[i][:2] == "-c"):
+        if (argList[i][:4] == "-cac"):
+            frame_cache = True
+        elif (argList[i][:2] == "-c"):
             i += 1
             case = str(argList[i])
         elif (argList[i][:2] == "-t"):
@@ -1150,14 +2476,53 @@ if __name__ == '__main__':
         elif (argList[i][:4] == "-ran"):
             i += 1
             strain_interval = float(argList[i])
+        elif (argList[i][:4] == "-sto"):
+            feature_store = True
+        elif (argList[i][:4] == "-run"):
+            per_run = True
         elif (argList[i][:4] == "-sce"):
             i += 1
             scenario = int(argList[i])
+        elif (argList[i][:3] == "-vo"):
+            i += 1
+            voronoi_workers = int(argList[i])
+        elif (argList[i][:3] == "-sy"):
+            i += 1
+            symmetry_parameter = load_symmetry_parameter(str(argList[i]))
+        elif (argList[i][:4] == "-she"):
+            i += 1
+            shell_number = int(argList[i])
+        elif (argList[i][:2] == "-o"):
+            i += 1
+            output_format = str(argList[i])
+        elif (argList[i][:3] == "-fa"):
+            i += 1
+            face_order_range = tuple(int(x) for x in str(argList[i]).split(','))
+        elif (argList[i][:2] == "-j"):
+            i += 1
+            jobs = int(argList[i])
+        elif (argList[i][:3] == "-fl"):
+            i += 1
+            frames_in_flight = int(argList[i])
+        elif (argList[i][:3] == "-fr"):
+            resume = False
+        elif (argList[i][:3] == "-pa"):
+            family_parallel = True
+        elif (argList[i][:3] == "-be"):
+            i += 1
+            benchmark = str(argList[i])
         elif (argList[i][:2] == "-h"):
             print(__doc__)
             exit(0)
         i += 1
 
     print(path_)
+    if benchmark is not None:
+        run_benchmark(benchmark, path_, path_output_, scenario)
+        exit(0)
     print("Running scenario:  %d" % scenario)
-    main_function(path_, path_output_, scenario)
+    main_function(path_, path_output_, scenario, frame_cache=frame_cache, voronoi_workers=voronoi_workers,
+                  symmetry_parameter=symmetry_parameter, shell_number=shell_number,
+                  face_order_range=face_order_range, output_format=output_format,
+                  per_run=per_run, feature_store=feature_store, jobs=jobs, frames_in_flight=frames_in_flight,
+                  family_parallel=family_parallel, resume=resume)
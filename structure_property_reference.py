@@ -0,0 +1,394 @@
+# -*- coding: UTF-8 -*-
+'''
+structure_property_reference.py
+The old implementations replaced in structure property.py, kept out of the production script.
+Only the -bench read|angular|hull|boop benchmarks of structure property.py import this module, to check the new
+implementations against these and to time them.
+'''
+from __future__ import division
+import re
+import os
+import math
+import importlib.util
+import boo
+import numpy as np
+from numba import jit
+from scipy.spatial import ConvexHull
+
+# 几何函数与 structure property.py 共用同一份，不在此重复
+_spec = importlib.util.spec_from_file_location('structure_property',
+                                               os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                            'structure property.py'))
+structure_property = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(structure_property)
+compute_cos_ijk = structure_property.compute_cos_ijk
+compute_dis = structure_property.compute_dis
+compute_tetrahedron_volume = structure_property.compute_tetrahedron_volume
+compute_solide_angle = structure_property.compute_solide_angle
+compute_simplice_area = structure_property.compute_simplice_area
+
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+@jit(nopython=True, cache=True)
+def compute_angular_element(neigh_offset_input, neigh_index_input, distance_input, points_input, a_list, b_list, c_list,
+                            radius, like_input):
+    # 邻域为 CSR: 第 a 个颗粒的邻居为 neigh_index_input[neigh_offset_input[a]:neigh_offset_input[a + 1]]
+    angular_value_in = np.empty_like(like_input)
+    for a in range(len(neigh_offset_input) - 1):
+        start = neigh_offset_input[a]
+        neigh_number = neigh_offset_input[a + 1] - start
+        value1 = 0.0
+        value2 = 0.0
+        value3 = 0.0
+        value4 = 0.0
+        value5 = 0.0
+        value6 = 0.0
+        value7 = 0.0
+        value8 = 0.0
+        value9 = 0.0
+        value10 = 0.0
+        value11 = 0.0
+        value12 = 0.0
+        value13 = 0.0
+        value14 = 0.0
+        value15 = 0.0
+        value16 = 0.0
+        value17 = 0.0
+        value18 = 0.0
+        value19 = 0.0
+        value20 = 0.0
+        value21 = 0.0
+        value22 = 0.0
+        for b in range(neigh_number):
+            for k_ in range(neigh_number - b - 1):
+                k = k_ + b + 1
+                rij = distance_input[start + b]
+                rik = distance_input[start + k]
+                posi = points_input[a]
+                posj = points_input[neigh_index_input[start + b]]
+                posk = points_input[neigh_index_input[start + k]]
+                rjk = compute_dis(posj, posk)
+                cos_ijk = compute_cos_ijk(posi, posj, posk)
+                r_2 = rij ** 2 + rik ** 2 + rjk ** 2
+                value1 += math.exp(-(r_2 / (radius * a_list[0]) ** 2)) * (1 + b_list[0] * cos_ijk) ** c_list[0]
+                value2 += math.exp(-(r_2 / (radius * a_list[1]) ** 2)) * (1 + b_list[1] * cos_ijk) ** c_list[1]
+                value3 += math.exp(-(r_2 / (radius * a_list[2]) ** 2)) * (1 + b_list[2] * cos_ijk) ** c_list[2]
+                value4 += math.exp(-(r_2 / (radius * a_list[3]) ** 2)) * (1 + b_list[3] * cos_ijk) ** c_list[3]
+                value5 += math.exp(-(r_2 / (radius * a_list[4]) ** 2)) * (1 + b_list[4] * cos_ijk) ** c_list[4]
+                value6 += math.exp(-(r_2 / (radius * a_list[5]) ** 2)) * (1 + b_list[5] * cos_ijk) ** c_list[5]
+                value7 += math.exp(-(r_2 / (radius * a_list[6]) ** 2)) * (1 + b_list[6] * cos_ijk) ** c_list[6]
+                value8 += math.exp(-(r_2 / (radius * a_list[7]) ** 2)) * (1 + b_list[7] * cos_ijk) ** c_list[7]
+                value9 += math.exp(-(r_2 / (radius * a_list[8]) ** 2)) * (1 + b_list[8] * cos_ijk) ** c_list[8]
+                value10 += math.exp(-(r_2 / (radius * a_list[9]) ** 2)) * (1 + b_list[9] * cos_ijk) ** c_list[9]
+                value11 += math.exp(-(r_2 / (radius * a_list[10]) ** 2)) * (1 + b_list[10] * cos_ijk) ** c_list[10]
+                value12 += math.exp(-(r_2 / (radius * a_list[11]) ** 2)) * (1 + b_list[11] * cos_ijk) ** c_list[11]
+                value13 += math.exp(-(r_2 / (radius * a_list[12]) ** 2)) * (1 + b_list[12] * cos_ijk) ** c_list[12]
+                value14 += math.exp(-(r_2 / (radius * a_list[13]) ** 2)) * (1 + b_list[13] * cos_ijk) ** c_list[13]
+                value15 += math.exp(-(r_2 / (radius * a_list[14]) ** 2)) * (1 + b_list[14] * cos_ijk) ** c_list[14]
+                value16 += math.exp(-(r_2 / (radius * a_list[15]) ** 2)) * (1 + b_list[15] * cos_ijk) ** c_list[15]
+                value17 += math.exp(-(r_2 / (radius * a_list[16]) ** 2)) * (1 + b_list[16] * cos_ijk) ** c_list[16]
+                value18 += math.exp(-(r_2 / (radius * a_list[17]) ** 2)) * (1 + b_list[17] * cos_ijk) ** c_list[17]
+                value19 += math.exp(-(r_2 / (radius * a_list[18]) ** 2)) * (1 + b_list[18] * cos_ijk) ** c_list[18]
+                value20 += math.exp(-(r_2 / (radius * a_list[19]) ** 2)) * (1 + b_list[19] * cos_ijk) ** c_list[19]
+                value21 += math.exp(-(r_2 / (radius * a_list[20]) ** 2)) * (1 + b_list[20] * cos_ijk) ** c_list[20]
+                value22 += math.exp(-(r_2 / (radius * a_list[21]) ** 2)) * (1 + b_list[21] * cos_ijk) ** c_list[21]
+        angular_value_in[0][a] = value1
+        angular_value_in[1][a] = value2
+        angular_value_in[2][a] = value3
+        angular_value_in[3][a] = value4
+        angular_value_in[4][a] = value5
+        angular_value_in[5][a] = value6
+        angular_value_in[6][a] = value7
+        angular_value_in[7][a] = value8
+        angular_value_in[8][a] = value9
+        angular_value_in[9][a] = value10
+        angular_value_in[10][a] = value11
+        angular_value_in[11][a] = value12
+        angular_value_in[12][a] = value13
+        angular_value_in[13][a] = value14
+        angular_value_in[14][a] = value15
+        angular_value_in[15][a] = value16
+        angular_value_in[16][a] = value17
+        angular_value_in[17][a] = value18
+        angular_value_in[18][a] = value19
+        angular_value_in[19][a] = value20
+        angular_value_in[20][a] = value21
+        angular_value_in[21][a] = value22
+    return angular_value_in
+
+
+def compute_interstice_area_monosize(voronoi_neighbour_use_input, points_input, radius_input):
+    interstice_area_in = []
+    for a in range(len(voronoi_neighbour_use_input)):
+        if len(voronoi_neighbour_use_input[a]) >= 4:
+            points_now = []
+            for b in range(len(voronoi_neighbour_use_input[a])):
+                points_now.append(points_input[voronoi_neighbour_use_input[a][b]])
+            ch = ConvexHull(points_now)
+            simplice = np.array(ch.simplices)
+            interstice_area_mid = np.zeros(shape=[len(simplice), ])
+            interstice_area_x = compute_interstice_area_monosize_single_particle(simplice,
+                                                                                 np.array(points_now),
+                                                                                 radius_input,
+                                                                                 interstice_area_mid)
+            interstice_area_in.append([np.min(interstice_area_x),
+                                       np.max(interstice_area_x),
+                                       np.mean(interstice_area_x),
+                                       np.std(interstice_area_x, ddof=1)])
+        else:
+            interstice_area_in.append([0.0, 0.0, 0.0, 0.0])
+    return np.array(interstice_area_in)
+
+
+@jit(nopython=True, cache=True)
+def compute_interstice_area_monosize_single_particle(simplice, points_now, radius_input, interstice_area_mid):
+    interstice_area_x = interstice_area_mid
+    for a in range(len(simplice)):
+        area_triangle = compute_simplice_area(points_now[simplice[a][0]],
+                                              points_now[simplice[a][1]], points_now[simplice[a][2]])
+        area_pack = (math.pi * radius_input ** 2) / 4
+        interstice_area_x[a] = (area_triangle - area_pack) / area_triangle
+    return interstice_area_x
+
+
+def compute_interstice_volume(voronoi_neighbour_use_input, points_input, radius_input):
+    interstice_volume_in = []
+    for a in range(len(voronoi_neighbour_use_input)):
+        if len(voronoi_neighbour_use_input[a]) >= 4:
+            points_now = []
+            radius_now = []
+            origin_particle = points_input[a]
+            origin_radius = radius_input[a]
+            for b in range(len(voronoi_neighbour_use_input[a])):
+                points_now.append(points_input[voronoi_neighbour_use_input[a][b]])
+                radius_now.append(radius_input[voronoi_neighbour_use_input[a][b]])
+            ch = ConvexHull(points_now)
+            simplice = np.array(ch.simplices)
+            interstice_volume_mid = np.zeros(shape=[len(simplice), ])
+            interstice_volume_x = compute_interstice_volume_single_particle(simplice,
+                                                                            np.array(points_now),
+                                                                            np.array(radius_now),
+                                                                            interstice_volume_mid,
+                                                                            origin_particle,
+                                                                            origin_radius)
+
+            interstice_volume_in.append([np.min(interstice_volume_x),
+                                         np.max(interstice_volume_x),
+                                         np.mean(interstice_volume_x),
+                                         np.std(interstice_volume_x, ddof=1)])
+        else:
+            interstice_volume_in.append([0.0, 0.0, 0.0, 0.0])
+    return np.array(interstice_volume_in)
+
+
+@jit(nopython=True, cache=True)
+def compute_interstice_volume_single_particle(simplice, points_now, radius_now, interstice_volume_mid,
+                                              origin_particle, origin_radius):
+    interstice_volume_x = interstice_volume_mid
+    for a in range(len(simplice)):
+        volume_triangle = compute_tetrahedron_volume(points_now[simplice[a][0]],
+                                                     points_now[simplice[a][1]], points_now[simplice[a][2]],
+                                                     origin_particle)
+        if volume_triangle == 0:
+            # 处于边界上的颗粒计算时会触发错误，在此随机赋予一个值，因为边界上的颗粒不参与到以后的计算中
+            interstice_volume_x[a] = 0
+        else:
+            volume_pack = (compute_solide_angle(origin_particle, points_now[simplice[a][0]], points_now[simplice[a][1]],
+                                                points_now[simplice[a][2]])
+                           * origin_radius ** 3 +
+                           compute_solide_angle(points_now[simplice[a][2]], origin_particle,
+                                                points_now[simplice[a][0]], points_now[simplice[a][1]])
+                           * radius_now[simplice[a][2]] ** 3 +
+                           compute_solide_angle(points_now[simplice[a][1]],
+                                                points_now[simplice[a][2]], origin_particle, points_now[simplice[a][0]])
+                           * radius_now[simplice[a][1]] ** 3 +
+                           compute_solide_angle(points_now[simplice[a][0]], points_now[simplice[a][1]],
+                                                points_now[simplice[a][2]], origin_particle) * radius_now[
+                               simplice[a][0]] ** 3) \
+                          / 3
+            interstice_volume_x[a] = (volume_triangle - volume_pack) / volume_triangle
+    return interstice_volume_x
+
+
+def compute_cluster_packing_efficiency(voronoi_neighbour_use_input, points_input, radius_input):
+    # compute cluster packing efficiency
+    # Reference: Yang, L. et al. Atomic-scale mechanisms of the glass-forming ability in metallic glasses. Phys. Rev. Lett. 109, 105502 (2012).
+    cluster_packing_efficiency = np.zeros(shape=[len(voronoi_neighbour_use_input), ])
+    for a in range(len(voronoi_neighbour_use_input)):
+        if len(voronoi_neighbour_use_input[a]) >= 4:
+            points_now = []
+            radius_now = []
+            origin_particle = points_input[a]
+            origin_radius = radius_input[a]
+            for b in range(len(voronoi_neighbour_use_input[a])):
+                points_now.append(points_input[voronoi_neighbour_use_input[a][b]])
+                radius_now.append(radius_input[voronoi_neighbour_use_input[a][b]])
+            cpe_ch = ConvexHull(points_now)
+            cpe_simplice = np.array(cpe_ch.simplices)
+            interstice_volume_mid = np.zeros(shape=[len(cpe_simplice), ])
+            cluster_packing_efficiency_x = compute_cluster_packing_efficiency_single_particle(cpe_simplice,
+                                                                                              np.array(points_now),
+                                                                                              np.array(radius_now),
+                                                                                              interstice_volume_mid,
+                                                                                              origin_particle,
+                                                                                              origin_radius)
+
+            cluster_packing_efficiency[a] = cluster_packing_efficiency_x
+        else:
+            cluster_packing_efficiency[a] = 0.0
+    return cluster_packing_efficiency
+
+
+@jit(nopython=True, cache=True)
+def compute_cluster_packing_efficiency_single_particle(simplice_input, points_now, radius_now, interstice_volume_mid,
+                                                       origin_particle, origin_radius):
+    triangle_volume_x = np.zeros_like(interstice_volume_mid)
+    pack_volume_x = np.zeros_like(interstice_volume_mid)
+    for b in range(len(simplice_input)):
+        volume_triangle = compute_tetrahedron_volume(points_now[simplice_input[b][0]],
+                                                     points_now[simplice_input[b][1]],
+                                                     points_now[simplice_input[b][2]],
+                                                     origin_particle)
+        volume_pack = (compute_solide_angle(origin_particle, points_now[simplice_input[b][0]],
+                                            points_now[simplice_input[b][1]],
+                                            points_now[simplice_input[b][2]])
+                       * origin_radius ** 3 +
+                       compute_solide_angle(points_now[simplice_input[b][2]], origin_particle,
+                                            points_now[simplice_input[b][0]], points_now[simplice_input[b][1]])
+                       * radius_now[simplice_input[b][2]] ** 3 +
+                       compute_solide_angle(points_now[simplice_input[b][1]],
+                                            points_now[simplice_input[b][2]], origin_particle,
+                                            points_now[simplice_input[b][0]])
+                       * radius_now[simplice_input[b][1]] ** 3 +
+                       compute_solide_angle(points_now[simplice_input[b][0]], points_now[simplice_input[b][1]],
+                                            points_now[simplice_input[b][2]], origin_particle) * radius_now[
+                           simplice_input[b][0]] ** 3) / 3
+        triangle_volume_x[b] = volume_triangle
+        pack_volume_x[b] = volume_pack
+    return np.sum(pack_volume_x) / np.sum(triangle_volume_x)
+
+
+def compute_boop_pyboo(voronoi_bonds, cutoff_bonds, points):
+    # 逐个 l 调用 pyboo 的旧实现
+    # compute boo based on voronoi neighbour and cutoff neighbour
+    # Reference: [1] Structure-property relationships from universal signatures of plasticity in disordered solids.
+    #            [2] https://pyboo.readthedocs.io/en/latest/intro.html
+    # step1. compute boo based on voronoi neighbour
+    # voronoi_bonds 由 voronoi_bond 得到，剔除了邻域不互相对称的颗粒
+    bonds1 = voronoi_bonds
+    inside1 = np.array([True] * len(points))
+
+    q2m_1 = boo.bonds2qlm(points, bonds1, l=2)
+    q4m_1 = boo.bonds2qlm(points, bonds1, l=4)
+    q6m_1 = boo.bonds2qlm(points, bonds1, l=6)
+    q8m_1 = boo.bonds2qlm(points, bonds1, l=8)
+    q10m_1 = boo.bonds2qlm(points, bonds1, l=10)
+
+    Q2m_1, inside1_2_2 = boo.coarsegrain_qlm(q2m_1, bonds1, inside1)
+    Q4m_1, inside1_2_4 = boo.coarsegrain_qlm(q4m_1, bonds1, inside1)
+    Q6m_1, inside1_2_6 = boo.coarsegrain_qlm(q6m_1, bonds1, inside1)
+    Q8m_1, inside1_2_8 = boo.coarsegrain_qlm(q8m_1, bonds1, inside1)
+    Q10m_1, inside1_2_10 = boo.coarsegrain_qlm(q10m_1, bonds1, inside1)
+
+    q2_1 = boo.ql(q2m_1)
+    q4_1 = boo.ql(q4m_1)
+    q6_1 = boo.ql(q6m_1)
+    q8_1 = boo.ql(q8m_1)
+    q10_1 = boo.ql(q10m_1)
+
+    w2_1 = boo.wl(q2m_1)
+    w4_1 = boo.wl(q4m_1)
+    w6_1 = boo.wl(q6m_1)
+    w8_1 = boo.wl(q8m_1)
+    w10_1 = boo.wl(q10m_1)
+
+    Q2_1 = boo.ql(Q2m_1)
+    Q4_1 = boo.ql(Q4m_1)
+    Q6_1 = boo.ql(Q6m_1)
+    Q8_1 = boo.ql(Q8m_1)
+    Q10_1 = boo.ql(Q10m_1)
+
+    W2_1 = boo.wl(Q2m_1)
+    W4_1 = boo.wl(Q4m_1)
+    W6_1 = boo.wl(Q6m_1)
+    W8_1 = boo.wl(Q8m_1)
+    W10_1 = boo.wl(Q10m_1)
+    # step2. compute boo based on cutoff neighbour
+    # cutoff_bonds: 3r 截断邻域的颗粒对
+    bonds2 = cutoff_bonds
+    inside2 = np.array([True] * len(points))
+
+    q2m_2 = boo.bonds2qlm(points, bonds2, l=2)
+    q4m_2 = boo.bonds2qlm(points, bonds2, l=4)
+    q6m_2 = boo.bonds2qlm(points, bonds2, l=6)
+    q8m_2 = boo.bonds2qlm(points, bonds2, l=8)
+    q10m_2 = boo.bonds2qlm(points, bonds2, l=10)
+
+    Q2m_2, inside2_2_2 = boo.coarsegrain_qlm(q2m_2, bonds2, inside2)
+    Q4m_2, inside2_2_4 = boo.coarsegrain_qlm(q4m_2, bonds2, inside2)
+    Q6m_2, inside2_2_6 = boo.coarsegrain_qlm(q6m_2, bonds2, inside2)
+    Q8m_2, inside2_2_8 = boo.coarsegrain_qlm(q8m_2, bonds2, inside2)
+    Q10m_2, inside2_2_10 = boo.coarsegrain_qlm(q10m_2, bonds2, inside2)
+
+    q2_2 = boo.ql(q2m_2)
+    q4_2 = boo.ql(q4m_2)
+    q6_2 = boo.ql(q6m_2)
+    q8_2 = boo.ql(q8m_2)
+    q10_2 = boo.ql(q10m_2)
+
+    w2_2 = boo.wl(q2m_2)
+    w4_2 = boo.wl(q4m_2)
+    w6_2 = boo.wl(q6m_2)
+    w8_2 = boo.wl(q8m_2)
+    w10_2 = boo.wl(q10m_2)
+
+    Q2_2 = boo.ql(Q2m_2)
+    Q4_2 = boo.ql(Q4m_2)
+    Q6_2 = boo.ql(Q6m_2)
+    Q8_2 = boo.ql(Q8m_2)
+    Q10_2 = boo.ql(Q10m_2)
+
+    W2_2 = boo.wl(Q2m_2)
+    W4_2 = boo.wl(Q4m_2)
+    W6_2 = boo.wl(Q6m_2)
+    W8_2 = boo.wl(Q8m_2)
+    W10_2 = boo.wl(Q10m_2)
+
+    boop_all = np.array(list(zip(q2_1, q4_1, q6_1, q8_1, q10_1,
+                                 w2_1, w4_1, w6_1, w8_1, w10_1,
+                                 q2_2, q4_2, q6_2, q8_2, q10_2,
+                                 w2_2, w4_2, w6_2, w8_2, w10_2,
+                                 Q2_1, Q4_1, Q6_1, Q8_1, Q10_1,
+                                 W2_1, W4_1, W6_1, W8_1, W10_1,
+                                 Q2_2, Q4_2, Q6_2, Q8_2, Q10_2,
+                                 W2_2, W4_2, W6_2, W8_2, W10_2)))
+
+    return boop_all
+
+
+def read_position_information_regex(dump_path, frame):
+    # 旧的逐行正则解析
+    particle_info = open(dump_path + '/dump-' + str(frame) + '.sample', 'r')
+    lines = particle_info.readlines()
+    particle_info.close()
+    lines = lines[9:]
+    Par_id = list(map(int, map(float, [re.findall(r'-?\d+\.?\d*e?[-+]?\d*', line)[0] for line in lines])))
+    Par_id_read = list(map(int, map(float, [re.findall(r'-?\d+\.?\d*e?[-+]?\d*', line)[0] for line in lines])))
+    Par_xcor_read = list(map(float, [re.findall(r'-?\d+\.?\d*e?[-+]?\d*', line)[3] for line in lines]))
+    Par_ycor_read = list(map(float, [re.findall(r'-?\d+\.?\d*e?[-+]?\d*', line)[4] for line in lines]))
+    Par_zcor_read = list(map(float, [re.findall(r'-?\d+\.?\d*e?[-+]?\d*', line)[5] for line in lines]))
+    Par_radius_read = list(map(float, [re.findall(r'-?\d+\.?\d*e?[-+]?\d*', line)[2] for line in lines]))
+    Par_id.sort()
+    Par_xcor = [Par_xcor_read[Par_id_read.index(Par_id[x])] for x in range(len(Par_id))]
+    Par_ycor = [Par_ycor_read[Par_id_read.index(Par_id[x])] for x in range(len(Par_id))]
+    Par_zcor = [Par_zcor_read[Par_id_read.index(Par_id[x])] for x in range(len(Par_id))]
+    Par_radius = [Par_radius_read[Par_id_read.index(Par_id[x])] for x in range(len(Par_id))]
+    Par_coord = np.array(list(zip(Par_xcor, Par_ycor, Par_zcor)))
+    x_min = float('%.4f' % (np.min(Par_xcor) - Par_radius[0]))
+    x_max = float('%.4f' % (np.max(Par_xcor) + Par_radius[0]))
+    y_min = float('%.4f' % (np.min(Par_ycor) - Par_radius[0]))
+    y_max = float('%.4f' % (np.max(Par_ycor) + Par_radius[0]))
+    z_min = float('%.4f' % (np.min(Par_zcor) - Par_radius[0]))
+    z_max = np.max(Par_zcor) + Par_radius[0]
+    boundary = [[x_min, x_max], [y_min, y_max], [z_min, z_max]]
+    return Par_coord, Par_radius, boundary